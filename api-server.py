@@ -0,0 +1,30 @@
+# api-server.py
+# MIT License
+# Code by ergonomech 2024. Licensed under MIT License.
+# Headless JSON API for the fusion pipeline: one endpoint per stage plus /v1/chain, served by uvicorn workers.
+
+import os
+import argparse
+
+import uvicorn
+from utils import Config
+from utils.logger import setup_log
+
+# Load and validate configuration (published to os.environ, so inherited by the worker processes)
+Config.load_env()
+logger = setup_log()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the art style fusion stages as a JSON API.")
+    parser.add_argument("--host", default=os.getenv("API_SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_SERVER_PORT", "7634")))
+    parser.add_argument("-w", "--workers", type=int, default=int(os.getenv("API_SERVER_WORKERS", "1")),
+                        help="Worker processes; stage limits and caches apply per worker")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logger.info(f"Serving the fusion API on http://{args.host}:{args.port} with {args.workers} worker(s)")
+    uvicorn.run("utils.server:create_app", factory=True, host=args.host, port=args.port, workers=args.workers, log_level="warning")
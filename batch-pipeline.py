@@ -0,0 +1,239 @@
+# batch-pipeline.py
+# MIT License
+# Code by ergonomech 2024. Licensed under MIT License.
+# Headless run of the fusion chain (style -> image description -> artist -> prompt -> SD) over a folder of images.
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+from utils import Config, pipeline
+from utils.errors import APIError
+from utils.logger import setup_log
+from utils.ollama import OllamaModels
+from utils.tokens import truncate
+from utils.transport import Transport
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+
+logger = setup_log()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the art style fusion chain over a directory or manifest of images.")
+    parser.add_argument("input", help="Image directory, or a manifest (.txt of paths, or .jsonl with 'image' and optional 'style')")
+    parser.add_argument("-o", "--output", default="fusion_prompts.jsonl", help="JSONL output; existing successful items are skipped")
+    parser.add_argument("-s", "--style", action="append", default=[], help="Art style to apply (repeatable); defaults to the manifest's styles")
+    parser.add_argument("--vision-provider", default="openai", choices=sorted(pipeline.PROVIDERS))
+    parser.add_argument("--prompt-provider", default="openai", choices=sorted(pipeline.PROVIDERS))
+    parser.add_argument("-c", "--concurrency", action="append", default=[], metavar="PROVIDER=N",
+                        help="Concurrent requests per provider (default 4, ollama 1)")
+    parser.add_argument("--nsfw", action="store_true", help="Include NSFW context in every stage")
+    parser.add_argument("--no-sd", action="store_true", help="Skip the Stable Diffusion conversion stage")
+    parser.add_argument("--fused", action="store_true",
+                        help="Produce artist, prompt and SD prompt in one JSON request (staged calls if the reply is unusable)")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache (default: RESPONSE_CACHE_ENABLED)")
+    return parser.parse_args(argv)
+
+
+def load_items(source, styles):
+    """Expand the input into (id, image, style) work items."""
+    if os.path.isdir(source):
+        entries = [
+            {"image": os.path.join(source, name)}
+            for name in sorted(os.listdir(source))
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+    else:
+        with open(source, "r", encoding="utf-8") as manifest:
+            lines = [line.strip() for line in manifest if line.strip()]
+        entries = [json.loads(line) if line.startswith("{") else {"image": line} for line in lines]
+    items = []
+    for entry in entries:
+        if not entry.get("style") and not styles:
+            raise SystemExit(f"No style for {entry['image']}: pass --style or set 'style' in the manifest")
+        for style in ([entry["style"]] if entry.get("style") else styles):
+            items.append((f"{entry.get('id') or entry['image']}::{style}", entry["image"], style))
+    return items
+
+
+def completed_ids(path):
+    """IDs already written to the output without an error, for resuming."""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, "r", encoding="utf-8") as output:
+        for line in output:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from an interrupted run
+            if not record.get("error"):
+                done.add(record["id"])
+    return done
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+class Batch:
+    def __init__(self, args):
+        self.args = args
+        self.use_cache = Config.get("RESPONSE_CACHE_ENABLED") and not args.no_cache
+        limits = {"ollama": 1}
+        for spec in args.concurrency:
+            provider, _, count = spec.partition("=")
+            limits[provider] = int(count)
+        self.limits = {name: limits.get(name, 4) for name in pipeline.PROVIDERS}
+        self.semaphores = {name: asyncio.Semaphore(n) for name, n in self.limits.items()}
+        self.shared = {}
+        self.latencies = {stage: [] for stage in pipeline.STAGES + ("fused",)}
+        self.ttfts = []
+        self.failed = 0
+        self.written = 0
+
+    async def stage(self, stage, provider, kind, build, *inputs):
+        """Run one stage under the provider's concurrency cap and return its text."""
+        async with self.semaphores[provider]:
+            api = pipeline.provider_api(provider, kind, self.use_cache)
+            stream = build(api, provider, *inputs)
+            try:
+                text = await stream.read()
+            except APIError as e:
+                raise APIError(f"{stage}: {str(e)}", e.provider, e.status) from e
+        self.latencies[stage].append(stream.elapsed or 0.0)
+        if stream.ttft is not None:
+            self.ttfts.append(stream.ttft)
+        return text
+
+    async def fused(self, provider, style, img_desc):
+        """Artist, prompt and SD prompt from one request under the provider's concurrency cap."""
+        async with self.semaphores[provider]:
+            api = pipeline.provider_api(provider, "prompt", self.use_cache)
+            try:
+                result, report = await pipeline.fused(api, provider, pipeline.base_prompts()["generate"], style, img_desc, self.args.nsfw)
+            except APIError as e:
+                raise APIError(f"fused: {str(e)}", e.provider, e.status) from e
+        self.latencies["fused"].append(report["seconds"])
+        return result, report
+
+    async def warm(self):
+        """Load the Ollama models this run uses up front so the first items do not pay the cold start."""
+        kinds = [kind for kind, provider in (("prompt", self.args.prompt_provider), ("vision", self.args.vision_provider)) if provider == "ollama"]
+        if not kinds:
+            return
+        apis = [pipeline.provider_api("ollama", kind) for kind in kinds]
+        try:
+            await OllamaModels.awarm(apis[0].url, [api.model for api in apis])
+        except APIError as e:
+            logger.warning(f"Ollama warm-up failed: {str(e)}")
+
+    def once(self, key, factory):
+        """Share one task between items that need the same style or image description; a failed task is
+        forgotten so the next item retries it instead of inheriting the error."""
+        def forget_failure(task):
+            if (task.cancelled() or task.exception()) and self.shared.get(key) is task:
+                del self.shared[key]
+
+        if key not in self.shared:
+            self.shared[key] = asyncio.ensure_future(factory())
+            self.shared[key].add_done_callback(forget_failure)
+        return self.shared[key]
+
+    async def run_item(self, item_id, image, style):
+        args = self.args
+        prompt_provider, vision_provider = args.prompt_provider, args.vision_provider
+        record = {"id": item_id, "image": image, "style": style}
+        started = time.perf_counter()
+        try:
+            style_task = self.once(("style", style), lambda: self.stage(
+                "style", prompt_provider, "prompt", pipeline.style_desc, style, args.nsfw))
+            image_task = self.once(("image", image), lambda: self.stage(
+                "image", vision_provider, "vision", pipeline.image_desc, image, args.nsfw))
+            results = await asyncio.gather(style_task, image_task, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+            record["style_desc"], record["image_desc"] = results
+            if args.fused:
+                result, report = await self.fused(prompt_provider, style, record["image_desc"])
+                record.update(result, mode=report["mode"])
+                if args.no_sd:
+                    del record["sd_prompt"]
+            else:
+                record["artist"] = await self.stage(
+                    "artist", prompt_provider, "prompt", pipeline.artist_rec, style, record["image_desc"], args.nsfw)
+                record["prompt"] = truncate(await self.stage(
+                    "generate", prompt_provider, "prompt", pipeline.prompt_gen, pipeline.base_prompts()["generate"],
+                    style, record["image_desc"], record["artist"], args.nsfw,
+                ), Config.get("TOKEN_LIMIT"))
+                if not args.no_sd:
+                    record["sd_prompt"] = await self.stage(
+                        "sd_convert", prompt_provider, "prompt", pipeline.sd_prompt, record["prompt"], args.nsfw)
+        except Exception as e:
+            logger.error(f"{item_id} failed: {str(e)}")
+            record["error"] = str(e)
+            self.failed += 1
+        record["seconds"] = round(time.perf_counter() - started, 3)
+        return record
+
+    async def run(self, items, output):
+        queue = asyncio.Queue()
+        for item in items:
+            queue.put_nowait(item)
+
+        async def worker():
+            while not queue.empty():
+                record = await self.run_item(*queue.get_nowait())
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                self.written += 1
+                logger.info(f"[{self.written}/{len(items)}] {record['id']} in {record['seconds']}s")
+
+        workers = max(1, sum(self.limits[p] for p in {self.args.prompt_provider, self.args.vision_provider}))
+        await asyncio.gather(*(worker() for _ in range(min(workers, len(items)) or 1)))
+
+    def summary(self, skipped, seconds):
+        lines = [
+            f"Items: {self.written} processed ({self.failed} failed), {skipped} skipped as already done",
+            f"Wall time: {seconds:.1f}s, throughput: {self.written / seconds if seconds else 0:.2f} items/s",
+        ]
+        for stage, values in self.latencies.items():
+            if values:
+                lines.append(
+                    f"  {stage:<10} n={len(values):<5} p50={percentile(values, 50):.2f}s "
+                    f"p95={percentile(values, 95):.2f}s max={max(values):.2f}s"
+                )
+        if self.ttfts:
+            lines.append(f"  time to first token p50={percentile(self.ttfts, 50):.2f}s p95={percentile(self.ttfts, 95):.2f}s")
+        return "\n".join(lines)
+
+
+async def main(argv=None):
+    Config.load_env()
+    args = parse_args(argv)
+    Transport.configure(
+        pool_size=os.getenv("HTTP_POOL_SIZE", Transport.pool_size),
+        connect_timeout=os.getenv("HTTP_CONNECT_TIMEOUT", Transport.connect_timeout),
+        read_timeout=os.getenv("HTTP_READ_TIMEOUT", Transport.read_timeout),
+    )
+    items = load_items(args.input, args.style)
+    done = completed_ids(args.output)
+    pending = [item for item in items if item[0] not in done]
+    batch = Batch(args)
+    started = time.perf_counter()
+    with open(args.output, "a", encoding="utf-8") as output:
+        if pending:
+            await batch.warm()
+            await batch.run(pending, output)
+    print(batch.summary(len(items) - len(pending), time.perf_counter() - started), file=sys.stderr)
+    return 1 if batch.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,157 @@
+# Stand-in OpenAI-compatible and Ollama servers for benchmarks.
+# Serves /v1/chat/completions (streaming and non-streaming), /api/generate, /api/pull and /api/ps with
+# configurable time to first token, token rate, response length, model load time and error injection.
+
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, body, headers=()):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _tokens(self, body=None):
+        """Generated tokens; a JSON-mode request (response_format or format=json) gets a JSON object split into tokens."""
+        config = self.server.config
+        words = [f"token{i} " for i in range(config.tokens)]
+        body = body or {}
+        if body.get("response_format", {}).get("type") == "json_object" or body.get("format") == "json":
+            third = max(1, config.tokens // 3)
+            reply = {"artist": "".join(words[:third]).strip(), "prompt": "".join(words[third:2 * third]).strip(),
+                     "sd_prompt": "".join(words[2 * third:]).strip() or "token"}
+            text = json.dumps(reply)
+            words = [text[i:i + 8] for i in range(0, len(text), 8)]
+        time.sleep(config.ttft)
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(1.0 / config.tokens_per_second)
+            yield word
+
+    def _inject_error(self):
+        config = self.server.config
+        with self.server.lock:
+            failed = self.server.random.random() < config.error_rate
+        if failed:
+            headers = [("Retry-After", str(config.retry_after))] if config.error_status == 429 else []
+            self._json(config.error_status, {"error": "injected failure"}, headers)
+        return failed
+
+    def _load(self, model):
+        """Pay the model load time once per model until its keep-alive expires."""
+        with self.server.lock:
+            cold = self.server.loaded.get(model, 0) < time.time()
+            self.server.loaded[model] = time.time() + self.server.config.keep_alive
+        if cold:
+            time.sleep(self.server.config.load_seconds)
+
+    def do_GET(self):
+        if self.path == "/api/ps":
+            now = time.time()
+            with self.server.lock:
+                models = [name for name, expires in self.server.loaded.items() if expires > now]
+            self._json(200, {"models": [{"name": name, "model": name, "size_vram": 0} for name in models]})
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self._inject_error():
+            return
+        if self.path.endswith("/chat/completions"):
+            if body.get("stream"):
+                self._start_stream("text/event-stream")
+                for token in self._tokens(body):
+                    event = {"choices": [{"delta": {"content": token}}]}
+                    self._chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self._chunk(b"data: [DONE]\n\n")
+                self._chunk(b"")
+            else:
+                text = "".join(self._tokens(body))
+                self._json(200, {"choices": [{"message": {"content": text}}]})
+        elif self.path == "/api/generate":
+            self._load(body.get("model", ""))
+            if not body.get("prompt") and not body.get("images"):
+                self._json(200, {"model": body.get("model"), "response": "", "done": True, "done_reason": "load"})
+                return
+            self._start_stream("application/x-ndjson")
+            for token in self._tokens(body):
+                self._chunk((json.dumps({"response": token, "done": False}) + "\n").encode("utf-8"))
+            self._chunk((json.dumps({"response": "", "done": True}) + "\n").encode("utf-8"))
+            self._chunk(b"")
+        elif self.path == "/api/pull":
+            self._start_stream("application/x-ndjson")
+            steps = self.server.config.pull_steps
+            total = steps * 10_000_000
+            for step in range(1, steps + 1):
+                time.sleep(self.server.config.ttft / steps)
+                event = {"status": "pulling layer", "digest": "sha256:0", "total": total, "completed": step * 10_000_000}
+                self._chunk((json.dumps(event) + "\n").encode("utf-8"))
+            self._chunk((json.dumps({"status": "success"}) + "\n").encode("utf-8"))
+            self._chunk(b"")
+        else:
+            self._json(404, {"error": "not found"})
+
+
+def make_server(port=0, ttft=0.05, tokens_per_second=200.0, tokens=64, error_rate=0.0, error_status=503,
+                retry_after=0.05, pull_steps=10, load_seconds=0.0, keep_alive=300.0, seed=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeHandler)
+    server.daemon_threads = True
+    server.request_queue_size = 256
+    server.config = argparse.Namespace(
+        ttft=ttft, tokens_per_second=tokens_per_second, tokens=tokens, error_rate=error_rate,
+        error_status=error_status, retry_after=retry_after, pull_steps=pull_steps,
+        load_seconds=load_seconds, keep_alive=keep_alive,
+    )
+    server.loaded = {}
+    server.random = random.Random(seed)
+    server.lock = threading.Lock()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible and Ollama server for benchmarks.")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--ttft", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, default=0.05)
+    parser.add_argument("--pull-steps", type=int, default=10)
+    parser.add_argument("--load-seconds", type=float, default=0.0, help="Delay of the first Ollama request per model")
+    parser.add_argument("--keep-alive", type=float, default=300.0, help="Seconds a loaded model stays resident")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    server = make_server(**vars(args))
+    print(f"http://127.0.0.1:{server.server_address[1]}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+# Benchmarks for utils.api, the fusion chain, image preprocessing and cold start against local stand-in servers.
+# Usage: python -m benchmarks.run -o results.json [--compare previous.json]
+
+import os
+import sys
+import json
+import time
+import asyncio
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from utils import pipeline
+from utils.api import API
+from utils.errors import APIError
+from utils.image import Img
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_servers.py")
+
+
+def summarize(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "p50": round(pct(50), 6), "p95": round(pct(95), 6), "p99": round(pct(99), 6),
+        "mean": round(sum(ordered) / len(ordered), 6), "max": round(ordered[-1], 6),
+    }
+
+
+def start_server(args):
+    """Run the fake server in its own process so it does not compete with the client for the GIL."""
+    command = [
+        sys.executable, SERVER_SCRIPT, "--ttft", str(args.ttft), "--tokens-per-second", str(args.tokens_per_second),
+        "--tokens", str(args.tokens), "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    return process, process.stdout.readline().strip()
+
+
+class Scenario:
+    """Collects latencies, time to first token and errors for one benchmark case."""
+
+    def __init__(self, suite, name, concurrency):
+        self.suite = suite
+        self.name = name
+        self.concurrency = concurrency
+        self.latencies = []
+        self.ttfts = []
+        self.errors = 0
+
+    def record(self, started, ttft=None, error=False):
+        if error:
+            self.errors += 1
+            return
+        self.latencies.append(time.perf_counter() - started)
+        if ttft is not None:
+            self.ttfts.append(ttft)
+
+    def result(self, seconds, peak_memory, **extra):
+        completed = len(self.latencies)
+        return {
+            "suite": self.suite, "name": self.name, "concurrency": self.concurrency,
+            "requests": completed + self.errors, "errors": self.errors, "seconds": round(seconds, 4),
+            "throughput": round(completed / seconds, 3) if seconds else 0.0,
+            "latency": summarize(self.latencies), "ttft": summarize(self.ttfts),
+            "peak_memory_bytes": peak_memory, **extra,
+        }
+
+
+def measure(run):
+    """Call run() under tracemalloc and return (seconds, peak traced bytes)."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        run()
+    finally:
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def sync_case(scenario, call, requests):
+    def one(i):
+        started = time.perf_counter()
+        try:
+            ttft = call(i)
+        except APIError:
+            scenario.record(started, error=True)
+            return
+        scenario.record(started, ttft)
+
+    def run():
+        with ThreadPoolExecutor(max_workers=scenario.concurrency) as pool:
+            list(pool.map(one, range(requests)))
+
+    return measure(run)
+
+
+def async_case(scenario, call, requests):
+    async def main():
+        semaphore = asyncio.Semaphore(scenario.concurrency)
+
+        async def one(i):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    ttft = await call(i)
+                except APIError:
+                    scenario.record(started, error=True)
+                    return
+                scenario.record(started, ttft)
+
+        await asyncio.gather(*(one(i) for i in range(requests)))
+
+    return measure(lambda: asyncio.run(main()))
+
+
+def api_suite(base_url, image_path, args):
+    chat_url = f"{base_url}/v1/chat/completions"
+
+    def chat():
+        return API("bench", chat_url, "bench-model", use_cache=False)
+
+    def ollama():
+        return API(url=base_url, model="bench-model", use_cache=False)
+
+    def drained(stream):
+        stream.read()
+        return stream.ttft
+
+    async def adrained(stream):
+        await stream.read()
+        return stream.ttft
+
+    # (name, is_async, call(i) returning time to first token or None)
+    cases = [
+        ("req", False, lambda i: chat().req(f"prompt {i}") and None),
+        ("stream", False, lambda i: drained(chat().stream(f"prompt {i}"))),
+        ("ollama_generate_completion", False, lambda i: drained(ollama().ollama_stream_completion(f"prompt {i}"))),
+        ("ollama_analyze_image", False, lambda i: drained(ollama().ollama_stream_image(image_path))),
+        ("pull_model", False, lambda i: ollama().pull_model("bench-model") and None),
+        ("areq", True, lambda i: _none(chat().areq(f"prompt {i}"))),
+        ("astream", True, lambda i: adrained(chat().astream(f"prompt {i}"))),
+        ("aollama_generate_completion", True, lambda i: adrained(ollama().aollama_stream_completion(f"prompt {i}"))),
+        ("aollama_analyze_image", True, lambda i: adrained(ollama().aollama_stream_image(image_path))),
+    ]
+    results = []
+    for name, is_async, call in cases:
+        if args.only and name not in args.only:
+            continue
+        for concurrency in args.concurrency:
+            scenario = Scenario("api", name, concurrency)
+            requests = max(args.requests, concurrency)
+            seconds, peak = (async_case if is_async else sync_case)(scenario, call, requests)
+            results.append(scenario.result(seconds, peak))
+            report(results[-1])
+    return results
+
+
+async def _none(coroutine):
+    await coroutine
+    return None
+
+
+def chain_suite(base_url, image_path, args):
+    """Full fusion chain (style, image, artist, prompt, SD) per item against the stand-in server."""
+    chat_url = f"{base_url}/v1/chat/completions"
+
+    async def chain(i):
+        api = API("bench", chat_url, "bench-model", use_cache=False)
+        style_stream = pipeline.style_desc(api, "openai", f"Style {i}", False)
+        style = await style_stream.read()
+        img_desc = await pipeline.image_desc(api, "openai", image_path, False).read()
+        artist = await pipeline.artist_rec(api, "openai", style, img_desc, False).read()
+        fusion = await pipeline.prompt_gen(api, "openai", "", style, img_desc, artist, False).read()
+        await pipeline.sd_prompt(api, "openai", fusion, False).read()
+        return style_stream.ttft
+
+    results = []
+    for concurrency in args.concurrency:
+        scenario = Scenario("chain", "fusion_chain", concurrency)
+        seconds, peak = async_case(scenario, chain, max(args.chain_items, concurrency))
+        results.append(scenario.result(seconds, peak))
+        report(results[-1])
+    return results
+
+
+def image_corpus(directory):
+    sizes = [(640, 480), (1920, 1080), (4000, 3000)]
+    corpus = []
+    for w, h in sizes:
+        img = Image.effect_mandelbrot((w, h), (-2.0, -1.5, 1.0, 1.5), 64).convert("RGB")
+        for fmt, ext in (("JPEG", "jpg"), ("PNG", "png"), ("WEBP", "webp")):
+            path = os.path.join(directory, f"corpus_{w}x{h}.{ext}")
+            img.save(path, format=fmt)
+            corpus.append((f"{w}x{h}.{ext}", path))
+    return corpus
+
+
+def image_suite(directory, args):
+    results = []
+    for label, path in image_corpus(directory):
+        for out_format in ("JPEG", "WEBP", "PNG"):
+            timings, sizes = [], []
+
+            def run():
+                for _ in range(args.image_repeats):
+                    prepared = Img.prepare(path, fmt=out_format, quality=85, max_pixels=1_000_000)
+                    timings.append(prepared.encode_seconds)
+                    sizes.append(prepared.size)
+
+            seconds, peak = measure(run)
+            results.append({
+                "suite": "image", "name": f"{label}->{out_format}", "concurrency": 1,
+                "requests": len(timings), "errors": 0, "seconds": round(seconds, 4),
+                "throughput": round(len(timings) / seconds, 3), "latency": summarize(timings), "ttft": None,
+                "peak_memory_bytes": peak, "encoded_bytes": sizes[-1],
+                "source_bytes": os.path.getsize(path),
+            })
+            report(results[-1])
+    return results
+
+
+# Cold-start scenarios, each timed in a fresh interpreter
+STARTUP_SCENARIOS = {
+    "import_pipeline": "import utils.pipeline",
+    "load_config": "from utils import Config; Config.load_env()",
+    "build_ui": "import runpy; runpy.run_path('gradio-app.py')['build_ui']()",
+}
+
+
+def startup_suite(args):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for name, code in STARTUP_SCENARIOS.items():
+        timings = []
+        for _ in range(args.startup_runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=root, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - started)
+        results.append({
+            "suite": "startup", "name": name, "concurrency": 1, "requests": len(timings), "errors": 0,
+            "seconds": round(sum(timings), 4), "throughput": round(len(timings) / sum(timings), 3),
+            "latency": summarize(timings), "ttft": None, "peak_memory_bytes": 0,
+        })
+        report(results[-1])
+    return results
+
+
+def report(result):
+    latency = result["latency"] or {}
+    print(
+        f"{result['suite']:<7} {result['name']:<30} c={result['concurrency']:<3} "
+        f"{result['throughput']:>9.2f}/s p50={latency.get('p50', 0):.4f}s p95={latency.get('p95', 0):.4f}s "
+        f"p99={latency.get('p99', 0):.4f}s errors={result['errors']} peak={result['peak_memory_bytes'] / 1e6:.1f}MB",
+        file=sys.stderr,
+    )
+
+
+def compare(results, previous_path):
+    """Print throughput and p95 changes against an earlier results file."""
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = {(r["suite"], r["name"], r["concurrency"]): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {previous_path}:", file=sys.stderr)
+    for result in results:
+        old = previous.get((result["suite"], result["name"], result["concurrency"]))
+        if not old or not old["throughput"] or not (old["latency"] and result["latency"]):
+            continue
+        throughput = result["throughput"] / old["throughput"] - 1
+        p95 = result["latency"]["p95"] / old["latency"]["p95"] - 1 if old["latency"]["p95"] else 0.0
+        print(f"  {result['suite']:<7} {result['name']:<30} c={result['concurrency']:<3} throughput {throughput:+.1%}  p95 {p95:+.1%}", file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark API methods, the fusion chain and image preprocessing.")
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Earlier results file to diff against")
+    parser.add_argument("--suite", action="append", choices=["api", "chain", "image", "startup"], help="Suites to run (default all)")
+    parser.add_argument("--only", action="append", help="Run only these API methods")
+    parser.add_argument("-c", "--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32, help="Requests per API scenario")
+    parser.add_argument("--chain-items", type=int, default=16)
+    parser.add_argument("--image-repeats", type=int, default=5)
+    parser.add_argument("--coalesce", action="store_true",
+                        help="Let identical concurrent requests share one upstream call (off so every request is measured)")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh interpreters per startup scenario")
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    suites = args.suite or ["api", "chain", "image", "startup"]
+    os.environ.setdefault("API_RETRY_BASE", "0.01")
+    os.environ["REQUEST_COALESCING_ENABLED"] = "true" if args.coalesce else "false"
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        image_path = os.path.join(directory, "bench.jpg")
+        Image.effect_mandelbrot((2048, 1536), (-2.0, -1.5, 1.0, 1.5), 64).convert("RGB").save(image_path)
+        if {"api", "chain"} & set(suites):
+            process, base_url = start_server(args)
+            try:
+                if "api" in suites:
+                    results += api_suite(base_url, image_path, args)
+                if "chain" in suites:
+                    results += chain_suite(base_url, image_path, args)
+            finally:
+                process.terminate()
+                process.wait()
+        if "image" in suites:
+            results += image_suite(directory, args)
+    if "startup" in suites:
+        results += startup_suite(args)
+    output = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": platform.python_version(),
+            "platform": platform.platform(), "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}", file=sys.stderr)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,10 @@
 # Credits to Gradio, PIL (Pillow), requests, and AI APIs.
 
 import os
+import time
 import platform
-import base64
+import threading
+import webbrowser
 
 # ----------------------------------------
 # Whitelist localhost (and our hostname) for Gradio’s networking
@@ -15,13 +17,22 @@ os.environ["no_proxy"] = os.getenv("no_proxy", "") + ",localhost,127.0.0.1,::1"
 # ----------------------------------------
 
 import gradio as gr
-from dotenv import load_dotenv
-from utils.api import API
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from utils import Config, metrics, pipeline
+from utils.api import API, provider_name
+from utils.cache import ResponseCache
+from utils.errors import APIError
+from utils.hedge import ProviderHealth
 from utils.image import Img
 from utils.logger import setup_log
+from utils.ollama import OllamaModels
+from utils.tokens import truncate
+from utils.transport import Transport
 
-# Load environment variables
-load_dotenv(override=True)
+# Load and validate configuration (static_config.json, environment, .env)
+Config.load_env()
 logger = setup_log()
 
 # Detect operating system and hostname
@@ -37,43 +48,52 @@ os_type, hostname = get_hostname_and_os()
 
 # Utility function to retrieve environment variables with a default fallback
 def get_env_variable(var_name, default_value):
-    return os.getenv(var_name, default_value)
+    return Config.get(var_name, default_value)
 
-# Load logo for the UI (base64-encoded)
+# Load logo for the UI (base64-encoded, cached)
 def get_logo_base64():
-    logo_path = os.path.join(os.path.dirname(__file__), 'assets', 'logo.png')
-    with open(logo_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+    return Config.asset_base64('logo.png')
 
-# Read markdown content for the UI
+# Read markdown content for the UI (cached)
 def read_markdown_file(filename):
-    file_path = os.path.join(os.path.dirname(__file__), filename)
-    with open(file_path, "r", encoding="utf-8") as file:
-        return file.read()
-
-# NSFW handling function to append context when necessary
-def add_nsfw_context(prompt, nsfw):
-    if nsfw:
-        prompt += f" {nsfw_append}"
-    prompt += f" {no_semantic_explanation}"
-    return prompt
+    return Config.text(filename)
+
+# Stream model output into a Gradio component, refreshing at most every STREAM_REFRESH_SECONDS
+STREAM_REFRESH_SECONDS = 0.05
+
+async def stream_to_output(stream, stage, limit=None):
+    last = 0.0
+    try:
+        async for _ in stream:
+            now = time.perf_counter()
+            if now - last >= STREAM_REFRESH_SECONDS:
+                last = now
+                yield truncate(stream.text(), limit)
+    except APIError as e:
+        logger.error(f"{stage} failed: {str(e)}")
+        yield f"{truncate(stream.text(), limit)}\n\nError: {str(e)}".strip()
+        return
+    yield truncate(stream.text(), limit)
+    if stream.ttft is not None:
+        provider = getattr(stream, "provider", None)
+        stage = f"{stage} ({provider})" if provider else stage
+        logger.info(f"{stage}: first token after {stream.ttft:.2f}s, complete after {stream.elapsed:.2f}s")
 
 # Load base prompts and other settings from environment
-base_prompts = {
-    "style":       get_env_variable("BASE_STYLE_PROMPT", ""),
-    "image":       get_env_variable("BASE_IMAGE_PROMPT", ""),
-    "image_nsfw":  get_env_variable("BASE_IMAGE_NSFW_PROMPT", ""),
-    "artist":      get_env_variable("BASE_ARTIST_PROMPT", ""),
-    "generate":    get_env_variable("BASE_GENERATE_PROMPT", ""),
-    "sd_convert":  get_env_variable("SD_CONVERT_PROMPT", ""),
-}
-
-# NSFW & semantic explanation text
-nsfw_append            = get_env_variable("NSFW_APPEND", "")
-no_semantic_explanation= get_env_variable("NO_SEMANTIC_EXPLANATION", "")
+base_prompts = pipeline.base_prompts()
 
 # Available art styles
-art_styles = get_env_variable("ART_STYLES", "").split(",")
+art_styles = Config.art_styles()
+
+# Style sweep comparison table columns
+SWEEP_COLUMNS = ["Style", "Style Description", "Artist", "Artistic Prompt", "Seconds"]
+
+# Shared HTTP connection pools (keep-alive, per base URL)
+Transport.configure(
+    pool_size=get_env_variable("HTTP_POOL_SIZE", Transport.pool_size),
+    connect_timeout=get_env_variable("HTTP_CONNECT_TIMEOUT", Transport.connect_timeout),
+    read_timeout=get_env_variable("HTTP_READ_TIMEOUT", Transport.read_timeout),
+)
 
 # Default Ollama server & model
 DEFAULT_OLLAMA_URL   = get_env_variable("OLLAMA_SERVER_URL", "http://data-tamer-01.local:11434")
@@ -102,8 +122,13 @@ def build_ui():
         with gr.Accordion("Config", open=False):
             # Ollama
             ollama_url         = gr.Textbox(label="Ollama Server URL",    value=DEFAULT_OLLAMA_URL)
-            ollama_prompt_model= gr.Textbox(label="Ollama Prompt Model", value=DEFAULT_MODEL_NAME, interactive=True)
-            ollama_vision_model= gr.Textbox(label="Ollama Vision Model", value=DEFAULT_MODEL_NAME, interactive=True)
+            ollama_prompt_model= gr.Textbox(label="Ollama Prompt Model", value=get_env_variable('OLLAMA_PROMPT_MODEL', DEFAULT_MODEL_NAME), interactive=True)
+            ollama_vision_model= gr.Textbox(label="Ollama Vision Model", value=get_env_variable('OLLAMA_VISION_MODEL', DEFAULT_MODEL_NAME), interactive=True)
+            ollama_models      = gr.Textbox(label="Ollama Loaded Models", interactive=False)
+            ollama_pull_status = gr.Textbox(label="Ollama Pull Progress", interactive=False)
+            refresh_ollama     = gr.Button("Refresh Loaded Ollama Models")
+            preload_ollama     = gr.Button("Preload Ollama Models")
+            pull_ollama        = gr.Button("Pull Ollama Models")
 
             # OpenAI / OpenRouter
             openai_key         = gr.Textbox(label="OpenAI Key",       value=get_env_variable('OPENAI_API_KEY',''),       type="password")
@@ -120,6 +145,18 @@ def build_ui():
             top_p       = gr.Slider(label="Top P",        value=float(get_env_variable('TOP_P','0.9')),        minimum=0.1, maximum=1.0)
             token_limit = gr.Slider(label="Token Limit",  value=int(  get_env_variable('TOKEN_LIMIT','8192')), minimum=1000, maximum=8192)
 
+            # Response cache
+            use_cache         = gr.Checkbox(label="Use Response Cache", value=Config.get('RESPONSE_CACHE_ENABLED'), interactive=True)
+            cache_stats       = gr.Textbox(label="Response Cache Stats", interactive=False)
+            refresh_cache     = gr.Button("Refresh Cache Stats")
+
+            # Fastest-available mode: race the primary against a hedged secondary
+            primary_provider   = gr.Dropdown(choices=list(pipeline.PROVIDERS), value=get_env_variable('HEDGE_PRIMARY','openai'), label="Fastest Mode Primary Provider")
+            secondary_provider = gr.Dropdown(choices=list(pipeline.PROVIDERS), value=get_env_variable('HEDGE_SECONDARY','openrouter'), label="Fastest Mode Secondary Provider")
+            hedge_percentile   = gr.Slider(label="Hedge After Primary Latency Percentile", value=float(get_env_variable('HEDGE_PERCENTILE','95')), minimum=50, maximum=99, step=1)
+            provider_health    = gr.Textbox(label="Provider Health", interactive=False)
+            refresh_health     = gr.Button("Refresh Provider Health")
+
         # Art Style Selection
         with gr.Accordion("Art Style Selection", open=False):
             art_style             = gr.Dropdown(choices=art_styles, label="Select Art Style")
@@ -128,15 +165,17 @@ def build_ui():
             get_style_openai      = gr.Button("Generate Style Description (OpenAI)")
             get_style_openrouter  = gr.Button("Generate Style Description (OpenRouter)")
             get_style_ollama      = gr.Button("Generate Style Description (Ollama)")
+            get_style_fastest     = gr.Button("Generate Style Description (Fastest Available)")
 
         # Image Analysis
         with gr.Accordion("Input Description", open=False):
-            img_input            = gr.Image(label="Upload Image", type="pil")
+            img_input            = gr.Image(label="Upload Image", type="filepath")
             img_desc_output      = gr.Code(label="Generated Description", interactive=True, language="markdown")
             nsfw_checkbox_image  = gr.Checkbox(label="Include NSFW Context for Image Description", interactive=True)
             get_desc_openai      = gr.Button("Generate Image Description (OpenAI)")
             get_desc_openrouter  = gr.Button("Generate Image Description (OpenRouter)")
             get_desc_ollama      = gr.Button("Generate Image Description (Ollama)")
+            get_desc_fastest     = gr.Button("Generate Image Description (Fastest Available)")
 
         # Artist Recommendation
         with gr.Accordion("Artist Recommendation", open=False):
@@ -145,6 +184,7 @@ def build_ui():
             get_artist_openai      = gr.Button("Recommend Artist (OpenAI)")
             get_artist_openrouter  = gr.Button("Recommend Artist (OpenRouter)")
             get_artist_ollama      = gr.Button("Recommend Artist (Ollama)")
+            get_artist_fastest     = gr.Button("Recommend Artist (Fastest Available)")
 
         # Artistic Prompt Generation
         with gr.Accordion("Generate Artistic Prompt", open=False):
@@ -154,6 +194,7 @@ def build_ui():
             generate_prompt_openai      = gr.Button("Generate Artistic Prompt (OpenAI)")
             generate_prompt_openrouter  = gr.Button("Generate Artistic Prompt (OpenRouter)")
             generate_prompt_ollama      = gr.Button("Generate Artistic Prompt (Ollama)")
+            generate_prompt_fastest     = gr.Button("Generate Artistic Prompt (Fastest Available)")
 
         # Stable Diffusion Prompt Conversion
         with gr.Accordion("Stable Diffusion Prompt", open=False):
@@ -162,75 +203,259 @@ def build_ui():
             convert_sd_openai      = gr.Button("Convert to SD Prompt (OpenAI)")
             convert_sd_openrouter  = gr.Button("Convert to SD Prompt (OpenRouter)")
             convert_sd_ollama      = gr.Button("Convert to SD Prompt (Ollama)")
+            convert_sd_fastest     = gr.Button("Convert to SD Prompt (Fastest Available)")
+
+        # Fused generation: artist, artistic prompt and SD prompt from one request
+        with gr.Accordion("One-Call Generation (Artist, Prompt and SD)", open=False):
+            fused_report        = gr.Textbox(label="One-Call Report", interactive=False)
+            fused_openai        = gr.Button("Generate Artist, Prompt and SD Prompt in One Call (OpenAI)")
+            fused_openrouter    = gr.Button("Generate Artist, Prompt and SD Prompt in One Call (OpenRouter)")
+            fused_ollama        = gr.Button("Generate Artist, Prompt and SD Prompt in One Call (Ollama)")
+
+        # Style sweep: the current image description across many styles, compared side by side
+        with gr.Accordion("Style Sweep", open=False):
+            sweep_styles        = gr.Dropdown(choices=art_styles, multiselect=True, label="Styles to Compare")
+            sweep_provider      = gr.Dropdown(choices=list(pipeline.PROVIDERS), value="openai", label="Sweep Provider")
+            sweep_concurrency   = gr.Slider(label="Concurrent Requests", value=pipeline.sweep_concurrency("openai"), minimum=1, maximum=16, step=1)
+            nsfw_checkbox_sweep = gr.Checkbox(label="Include NSFW Context for Style Sweep", interactive=True)
+            sweep_status        = gr.Textbox(label="Sweep Progress", interactive=False)
+            sweep_table         = gr.Dataframe(headers=SWEEP_COLUMNS, label="Style Comparison (select a row to use it)", wrap=True, interactive=False)
+            run_sweep           = gr.Button("Run Style Sweep")
+            stop_sweep          = gr.Button("Stop Style Sweep")
 
         # Handlers
-        def handle_style_desc(api_key, api_url, model, temp, top_p, token_limit, style, nsfw):
-            api = API(api_key, api_url, model, token_limit, temp, top_p)
-            prompt = add_nsfw_context(base_prompts['style'] + f" for the art style: {style}", nsfw)
-            return api.req(prompt)
-
-        def handle_image_desc(api_key, api_url, model, temp, top_p, token_limit, img, nsfw):
-            api = API(api_key, api_url, model, token_limit, temp, top_p)
-            prompt = base_prompts['image_nsfw'] if nsfw else base_prompts['image']
-            prompt = add_nsfw_context(prompt, nsfw)
-            img_data = Img.preprocess(img) if img else None
-            return api.req(prompt, img_data)
-
-        def handle_artist_rec(api_key, api_url, model, temp, top_p, token_limit, style, img_desc, nsfw):
-            api = API(api_key, api_url, model, token_limit, temp, top_p)
-            prompt = add_nsfw_context(base_prompts['artist'] + f" for style {style} and characteristics: '{img_desc}'", nsfw)
-            return api.req(prompt)
-
-        def handle_prompt_gen(api_key, api_url, model, temp, top_p, token_limit, base_inst, style, img_desc, artist_desc, nsfw):
-            api = API(api_key, api_url, model, token_limit, temp, top_p)
-            prompt = f"""
-            Scene Description: {img_desc}
-
-            Your task is to enhance this scene so that it embodies the art style of {style} and the unique characteristics of the artist {artist_desc}. Ensure the description incorporates the following details:
-
-            - Quality: Describe the scene as if it were rendered in the highest quality possible, with attention to minute details and textures.
-            - Aesthetic Harmony: Apply the visual themes and distinct artistic methods of {artist_desc}.
-            - Artistic Style: The overall aesthetic should clearly reflect the {style} style.
-
-            Produce a detailed, cohesive prompt that integrates these aspects.
-            """
-            prompt = add_nsfw_context(prompt, nsfw)
-            return api.req(prompt)[:token_limit]
-
-        def handle_sd_prompt(api_key, api_url, model, temp, top_p, token_limit, fusion_prompt, nsfw):
-            api = API(api_key, api_url, model, token_limit, temp, top_p)
-            prompt = add_nsfw_context(base_prompts['sd_convert'] + f" '{fusion_prompt}'", nsfw)
-            return api.req(prompt)
+        async def handle_style_desc(api_key, api_url, model, temp, top_p, token_limit, style, nsfw, use_cache):
+            api = API(api_key, api_url, model, token_limit, temp, top_p, use_cache)
+            async for text in stream_to_output(pipeline.style_desc(api, provider_name(api_url), style, nsfw), "style"):
+                yield text
+
+        async def handle_image_desc(api_key, api_url, model, temp, top_p, token_limit, img, nsfw, use_cache):
+            provider = provider_name(api_url)
+            api = API(api_key, api_url, model, token_limit, temp, top_p, use_cache, Img.settings(provider)["detail"])
+            async for text in stream_to_output(pipeline.image_desc(api, provider, img, nsfw), "image"):
+                yield text
+
+        async def handle_artist_rec(api_key, api_url, model, temp, top_p, token_limit, style, img_desc, nsfw, use_cache):
+            api = API(api_key, api_url, model, token_limit, temp, top_p, use_cache)
+            async for text in stream_to_output(pipeline.artist_rec(api, provider_name(api_url), style, img_desc, nsfw), "artist"):
+                yield text
+
+        async def handle_prompt_gen(api_key, api_url, model, temp, top_p, token_limit, base_inst, style, img_desc, artist_desc, nsfw, use_cache):
+            api = API(api_key, api_url, model, token_limit, temp, top_p, use_cache)
+            stream = pipeline.prompt_gen(api, provider_name(api_url), base_inst, style, img_desc, artist_desc, nsfw)
+            async for text in stream_to_output(stream, "generate", int(token_limit)):
+                yield text
+
+        async def handle_sd_prompt(api_key, api_url, model, temp, top_p, token_limit, fusion_prompt, nsfw, use_cache):
+            api = API(api_key, api_url, model, token_limit, temp, top_p, use_cache)
+            async for text in stream_to_output(pipeline.sd_prompt(api, provider_name(api_url), fusion_prompt, nsfw), "sd_convert"):
+                yield text
+
+        async def handle_ollama_style(style, nsfw, url, m, use_cache, token_limit):
+            stream = pipeline.style_desc(API(url=url, model=m, token_limit=token_limit, use_cache=use_cache), "ollama", style, nsfw)
+            async for text in stream_to_output(stream, "style"):
+                yield text
+
+        async def handle_ollama_image(img, nsfw, url, m, use_cache, token_limit):
+            stream = pipeline.image_desc(API(url=url, model=m, token_limit=token_limit, use_cache=use_cache), "ollama", img, nsfw)
+            async for text in stream_to_output(stream, "image"):
+                yield text
+
+        async def handle_ollama_artist(style, desc, nsfw, url, m, use_cache, token_limit):
+            stream = pipeline.artist_rec(API(url=url, model=m, token_limit=token_limit, use_cache=use_cache), "ollama", style, desc, nsfw)
+            async for text in stream_to_output(stream, "artist"):
+                yield text
+
+        async def handle_ollama_prompt(b, s, i, a, nsfw, url, m, use_cache, token_limit):
+            stream = pipeline.prompt_gen(API(url=url, model=m, token_limit=token_limit, use_cache=use_cache), "ollama", b, s, i, a, nsfw)
+            async for text in stream_to_output(stream, "generate", int(token_limit)):
+                yield text
+
+        async def handle_ollama_sd(p, nsfw, url, m, use_cache, token_limit):
+            stream = pipeline.sd_prompt(API(url=url, model=m, token_limit=token_limit, use_cache=use_cache), "ollama", p, nsfw)
+            async for text in stream_to_output(stream, "sd_convert"):
+                yield text
+
+        # Fused handlers: one JSON request fills the artist, prompt and SD boxes (staged calls if the reply is unusable)
+        async def run_fused(api, provider, base_inst, style, img_desc, nsfw):
+            yield gr.update(), gr.update(), gr.update(), "Generating artist, prompt and SD prompt in one call..."
+            try:
+                result, report = await pipeline.fused(api, provider, base_inst, style, img_desc, nsfw)
+            except APIError as e:
+                logger.error(f"fused failed: {str(e)}")
+                yield gr.update(), gr.update(), gr.update(), f"Error: {str(e)}"
+                return
+            summary = pipeline.fused_summary(report)
+            logger.info(summary)
+            yield result["artist"], result["prompt"], result["sd_prompt"], summary
+
+        async def handle_fused(api_key, api_url, model, temp, top_p, token_limit, base_inst, style, img_desc, nsfw, use_cache):
+            api = API(api_key, api_url, model, token_limit, temp, top_p, use_cache)
+            async for outputs in run_fused(api, provider_name(api_url), base_inst, style, img_desc, nsfw):
+                yield outputs
+
+        async def handle_ollama_fused(base_inst, style, img_desc, nsfw, url, m, use_cache, token_limit):
+            async for outputs in run_fused(API(url=url, model=m, token_limit=token_limit, use_cache=use_cache), "ollama", base_inst, style, img_desc, nsfw):
+                yield outputs
+
+        # Ollama model residency: loaded models, preloading and streamed pull progress
+        def format_loaded(models):
+            lines = [f"{m['name']}: {m.get('size_vram', 0) / 1e9:.1f} GB in VRAM, expires {m.get('expires_at', 'never')}" for m in models]
+            return "\n".join(lines) or "No models loaded"
+
+        def format_pull(model, event):
+            if "percent" in event:
+                return f"{model}: {event['status']} {event['percent']}% ({event.get('completed', 0) / 1e6:.0f}/{event['total'] / 1e6:.0f} MB)"
+            return f"{model}: {event.get('status', '')}"
+
+        async def handle_ollama_loaded(url):
+            try:
+                return format_loaded(await OllamaModels.aloaded(url))
+            except APIError as e:
+                return f"Error: {str(e)}"
+
+        async def handle_ollama_preload(url, prompt_model, vision_model):
+            try:
+                loaded = await OllamaModels.awarm(url, [prompt_model, vision_model])
+                models = await OllamaModels.aloaded(url)
+            except APIError as e:
+                return f"Error: {str(e)}"
+            notes = [f"Loaded {m} in {seconds:.1f}s" for m, seconds in loaded.items()] or ["Models already loaded"]
+            return "\n".join(notes + [format_loaded(models)])
+
+        async def handle_ollama_pull(url, prompt_model, vision_model):
+            progress, last = {}, 0.0
+            for model in dict.fromkeys([prompt_model, vision_model]):
+                try:
+                    async for event in API(url=url, model=model).apull_progress(model):
+                        progress[model] = format_pull(model, event)
+                        now = time.perf_counter()
+                        if now - last >= STREAM_REFRESH_SECONDS:
+                            last = now
+                            yield "\n".join(progress.values())
+                except APIError as e:
+                    logger.error(f"Pull of {model} failed: {str(e)}")
+                    progress[model] = f"{model}: Error: {str(e)}"
+            yield "\n".join(progress.values())
+
+        # Fastest-available handlers: the same stages raced across providers configured above
+        fastest_config = [openai_key, openai_url, openai_prompt_model, openai_vision_model,
+                          openrouter_key, openrouter_url, openrouter_prompt_model, openrouter_vision_model,
+                          ollama_url, ollama_prompt_model, ollama_vision_model,
+                          temp, top_p, token_limit, use_cache, primary_provider, secondary_provider, hedge_percentile]
+
+        def config_apis(config, kind):
+            (oa_key, oa_url, oa_prompt, oa_vision, or_key, or_url, or_prompt, or_vision,
+             ol_url, ol_prompt, ol_vision, temp, top_p, token_limit, use_cache) = config[:15]
+            vision = kind == "vision"
+            return {
+                "openai": API(oa_key, oa_url, oa_vision if vision else oa_prompt, token_limit, temp, top_p, use_cache, Img.settings("openai")["detail"]),
+                "openrouter": API(or_key, or_url, or_vision if vision else or_prompt, token_limit, temp, top_p, use_cache, Img.settings("openrouter")["detail"]),
+                "ollama": API(url=ol_url, model=ol_vision if vision else ol_prompt, token_limit=token_limit, use_cache=use_cache),
+            }
+
+        def fastest_stream(config, kind, build, *inputs):
+            primary, secondary, percentile = config[15:]
+            return pipeline.hedged(config_apis(config, kind), [primary, secondary], build, *inputs, percentile=percentile)
+
+        async def handle_fastest_style(style, nsfw, *config):
+            async for text in stream_to_output(fastest_stream(config, "prompt", pipeline.style_desc, style, nsfw), "style"):
+                yield text
+
+        async def handle_fastest_image(img, nsfw, *config):
+            async for text in stream_to_output(fastest_stream(config, "vision", pipeline.image_desc, img, nsfw), "image"):
+                yield text
+
+        async def handle_fastest_artist(style, img_desc, nsfw, *config):
+            async for text in stream_to_output(fastest_stream(config, "prompt", pipeline.artist_rec, style, img_desc, nsfw), "artist"):
+                yield text
+
+        async def handle_fastest_prompt(base_inst, style, img_desc, artist_desc, nsfw, *config):
+            stream = fastest_stream(config, "prompt", pipeline.prompt_gen, base_inst, style, img_desc, artist_desc, nsfw)
+            async for text in stream_to_output(stream, "generate", int(config[13])):
+                yield text
+
+        async def handle_fastest_sd(fusion_prompt, nsfw, *config):
+            async for text in stream_to_output(fastest_stream(config, "prompt", pipeline.sd_prompt, fusion_prompt, nsfw), "sd_convert"):
+                yield text
+
+        # Style sweep handlers: rows are added as each style finishes; Stop cancels the styles still running
+        async def handle_sweep(styles, provider, concurrency, base_inst, img_desc, nsfw, *config):
+            styles = list(dict.fromkeys(styles or []))
+            if not styles or not img_desc:
+                yield gr.update(), "Select styles to compare and generate an image description first."
+                return
+            rows = []
+            yield rows, f"Sweeping {len(styles)} styles on {provider}..."
+            api = config_apis(config, "prompt")[provider]
+            async for row in pipeline.sweep(api, provider, base_inst, styles, img_desc, nsfw, int(concurrency)):
+                prompt = f"Error: {row['error']}" if row["error"] else row["prompt"]
+                rows.append([row["style"], row["style_desc"], row["artist"], prompt, round(row["seconds"], 1)])
+                yield rows, f"{len(rows)}/{len(styles)} styles done"
+
+        def use_sweep_row(table, evt: gr.SelectData):
+            style, description, artist, prompt = table.iloc[evt.index[0]].tolist()[:4]
+            return style, description, artist, prompt
 
         # Wire buttons to handlers
-        get_style_openai.click(      fn=handle_style_desc, inputs=[openai_key, openai_url, openai_prompt_model, temp, top_p, token_limit, art_style, nsfw_checkbox_style], outputs=[style_desc])
-        get_style_openrouter.click(  fn=handle_style_desc, inputs=[openrouter_key, openrouter_url, openrouter_prompt_model, temp, top_p, token_limit, art_style, nsfw_checkbox_style], outputs=[style_desc])
-        get_style_ollama.click(      fn=lambda style, nsfw, url, m: API(url=url, model=m).ollama_generate_completion(add_nsfw_context(f"{base_prompts['style']} {style}", nsfw)), inputs=[art_style, nsfw_checkbox_style, ollama_url, ollama_prompt_model], outputs=[style_desc])
+        get_style_openai.click(      fn=handle_style_desc, inputs=[openai_key, openai_url, openai_prompt_model, temp, top_p, token_limit, art_style, nsfw_checkbox_style, use_cache], outputs=[style_desc])
+        get_style_openrouter.click(  fn=handle_style_desc, inputs=[openrouter_key, openrouter_url, openrouter_prompt_model, temp, top_p, token_limit, art_style, nsfw_checkbox_style, use_cache], outputs=[style_desc])
+        get_style_ollama.click(      fn=handle_ollama_style, inputs=[art_style, nsfw_checkbox_style, ollama_url, ollama_prompt_model, use_cache, token_limit], outputs=[style_desc])
+
+        get_desc_openai.click(       fn=handle_image_desc, inputs=[openai_key, openai_url, openai_vision_model, temp, top_p, token_limit, img_input, nsfw_checkbox_image, use_cache], outputs=[img_desc_output])
+        get_desc_openrouter.click(   fn=handle_image_desc, inputs=[openrouter_key, openrouter_url, openrouter_vision_model, temp, top_p, token_limit, img_input, nsfw_checkbox_image, use_cache], outputs=[img_desc_output])
+        get_desc_ollama.click(       fn=handle_ollama_image, inputs=[img_input, nsfw_checkbox_image, ollama_url, ollama_vision_model, use_cache, token_limit], outputs=[img_desc_output])
 
-        get_desc_openai.click(       fn=handle_image_desc, inputs=[openai_key, openai_url, openai_vision_model, temp, top_p, token_limit, img_input, nsfw_checkbox_image], outputs=[img_desc_output])
-        get_desc_openrouter.click(   fn=handle_image_desc, inputs=[openrouter_key, openrouter_url, openrouter_vision_model, temp, top_p, token_limit, img_input, nsfw_checkbox_image], outputs=[img_desc_output])
-        get_desc_ollama.click(       fn=lambda img, nsfw, url, m: API(url=url, model=m).ollama_analyze_image(img), inputs=[img_input, nsfw_checkbox_image, ollama_url, ollama_vision_model], outputs=[img_desc_output])
+        get_artist_openai.click(     fn=handle_artist_rec, inputs=[openai_key, openai_url, openai_prompt_model, temp, top_p, token_limit, art_style, img_desc_output, nsfw_checkbox_artist, use_cache], outputs=[artist_output])
+        get_artist_openrouter.click( fn=handle_artist_rec, inputs=[openrouter_key, openrouter_url, openrouter_prompt_model, temp, top_p, token_limit, art_style, img_desc_output, nsfw_checkbox_artist, use_cache], outputs=[artist_output])
+        get_artist_ollama.click(     fn=handle_ollama_artist, inputs=[art_style, img_desc_output, nsfw_checkbox_artist, ollama_url, ollama_prompt_model, use_cache, token_limit], outputs=[artist_output])
 
-        get_artist_openai.click(     fn=handle_artist_rec, inputs=[openai_key, openai_url, openai_prompt_model, temp, top_p, token_limit, art_style, img_desc_output, nsfw_checkbox_artist], outputs=[artist_output])
-        get_artist_openrouter.click( fn=handle_artist_rec, inputs=[openrouter_key, openrouter_url, openrouter_prompt_model, temp, top_p, token_limit, art_style, img_desc_output, nsfw_checkbox_artist], outputs=[artist_output])
-        get_artist_ollama.click(     fn=lambda style, desc, nsfw, url, m: API(url=url, model=m).ollama_generate_completion(add_nsfw_context(f"{base_prompts['artist']} {style} with {desc}", nsfw)), inputs=[art_style, img_desc_output, nsfw_checkbox_artist, ollama_url, ollama_prompt_model], outputs=[artist_output])
+        generate_prompt_openai.click(     fn=handle_prompt_gen, inputs=[openai_key, openai_url, openai_prompt_model, temp, top_p, token_limit, prompt_base, art_style, img_desc_output, artist_output, nsfw_checkbox_generate, use_cache], outputs=[gen_prompt])
+        generate_prompt_openrouter.click( fn=handle_prompt_gen, inputs=[openrouter_key, openrouter_url, openrouter_prompt_model, temp, top_p, token_limit, prompt_base, art_style, img_desc_output, artist_output, nsfw_checkbox_generate, use_cache], outputs=[gen_prompt])
+        generate_prompt_ollama.click(     fn=handle_ollama_prompt, inputs=[prompt_base, art_style, img_desc_output, artist_output, nsfw_checkbox_generate, ollama_url, ollama_prompt_model, use_cache, token_limit], outputs=[gen_prompt])
 
-        generate_prompt_openai.click(     fn=handle_prompt_gen, inputs=[openai_key, openai_url, openai_prompt_model, temp, top_p, token_limit, prompt_base, art_style, img_desc_output, artist_output, nsfw_checkbox_generate], outputs=[gen_prompt])
-        generate_prompt_openrouter.click( fn=handle_prompt_gen, inputs=[openrouter_key, openrouter_url, openrouter_prompt_model, temp, top_p, token_limit, prompt_base, art_style, img_desc_output, artist_output, nsfw_checkbox_generate], outputs=[gen_prompt])
-        generate_prompt_ollama.click(     fn=lambda b, s, i, a, nsfw, url, m: API(url=url, model=m).ollama_generate_completion(add_nsfw_context(f"{b} Style: {s}. Inspired by: {a}. Scene: {i}.", nsfw)), inputs=[prompt_base, art_style, img_desc_output, artist_output, nsfw_checkbox_generate, ollama_url, ollama_prompt_model], outputs=[gen_prompt])
+        convert_sd_openai.click(     fn=handle_sd_prompt, inputs=[openai_key, openai_url, openai_prompt_model, temp, top_p, token_limit, gen_prompt, nsfw_checkbox_sd, use_cache], outputs=[sd_prompt_output])
+        convert_sd_openrouter.click( fn=handle_sd_prompt, inputs=[openrouter_key, openrouter_url, openrouter_prompt_model, temp, top_p, token_limit, gen_prompt, nsfw_checkbox_sd, use_cache], outputs=[sd_prompt_output])
+        convert_sd_ollama.click(     fn=handle_ollama_sd, inputs=[gen_prompt, nsfw_checkbox_sd, ollama_url, ollama_prompt_model, use_cache, token_limit], outputs=[sd_prompt_output])
 
-        convert_sd_openai.click(     fn=handle_sd_prompt, inputs=[openai_key, openai_url, openai_prompt_model, temp, top_p, token_limit, gen_prompt, nsfw_checkbox_sd], outputs=[sd_prompt_output])
-        convert_sd_openrouter.click( fn=handle_sd_prompt, inputs=[openrouter_key, openrouter_url, openrouter_prompt_model, temp, top_p, token_limit, gen_prompt, nsfw_checkbox_sd], outputs=[sd_prompt_output])
-        convert_sd_ollama.click(     fn=lambda p, nsfw, url, m: API(url=url, model=m).ollama_generate_completion(add_nsfw_context(f"{base_prompts['sd_convert']} '{p}'", nsfw)), inputs=[gen_prompt, nsfw_checkbox_sd, ollama_url, ollama_prompt_model], outputs=[sd_prompt_output])
+        get_style_fastest.click(       fn=handle_fastest_style,  inputs=[art_style, nsfw_checkbox_style] + fastest_config, outputs=[style_desc])
+        get_desc_fastest.click(        fn=handle_fastest_image,  inputs=[img_input, nsfw_checkbox_image] + fastest_config, outputs=[img_desc_output])
+        get_artist_fastest.click(      fn=handle_fastest_artist, inputs=[art_style, img_desc_output, nsfw_checkbox_artist] + fastest_config, outputs=[artist_output])
+        generate_prompt_fastest.click( fn=handle_fastest_prompt, inputs=[prompt_base, art_style, img_desc_output, artist_output, nsfw_checkbox_generate] + fastest_config, outputs=[gen_prompt])
+        convert_sd_fastest.click(      fn=handle_fastest_sd,     inputs=[gen_prompt, nsfw_checkbox_sd] + fastest_config, outputs=[sd_prompt_output])
+
+        fused_outputs = [artist_output, gen_prompt, sd_prompt_output, fused_report]
+        fused_openai.click(     fn=handle_fused, inputs=[openai_key, openai_url, openai_prompt_model, temp, top_p, token_limit, prompt_base, art_style, img_desc_output, nsfw_checkbox_generate, use_cache], outputs=fused_outputs)
+        fused_openrouter.click( fn=handle_fused, inputs=[openrouter_key, openrouter_url, openrouter_prompt_model, temp, top_p, token_limit, prompt_base, art_style, img_desc_output, nsfw_checkbox_generate, use_cache], outputs=fused_outputs)
+        fused_ollama.click(     fn=handle_ollama_fused, inputs=[prompt_base, art_style, img_desc_output, nsfw_checkbox_generate, ollama_url, ollama_prompt_model, use_cache, token_limit], outputs=fused_outputs)
+
+        sweep = run_sweep.click(fn=handle_sweep, inputs=[sweep_styles, sweep_provider, sweep_concurrency, prompt_base, img_desc_output, nsfw_checkbox_sweep] + fastest_config, outputs=[sweep_table, sweep_status])
+        stop_sweep.click(fn=lambda: "Sweep stopped", inputs=[], outputs=[sweep_status], cancels=[sweep])
+        sweep_provider.change(fn=pipeline.sweep_concurrency, inputs=[sweep_provider], outputs=[sweep_concurrency])
+        sweep_table.select(fn=use_sweep_row, inputs=[sweep_table], outputs=[art_style, style_desc, artist_output, gen_prompt])
+
+        refresh_ollama.click(fn=handle_ollama_loaded,  inputs=[ollama_url], outputs=[ollama_models])
+        preload_ollama.click(fn=handle_ollama_preload, inputs=[ollama_url, ollama_prompt_model, ollama_vision_model], outputs=[ollama_models])
+        pull_ollama.click(   fn=handle_ollama_pull,    inputs=[ollama_url, ollama_prompt_model, ollama_vision_model], outputs=[ollama_pull_status])
+
+        refresh_health.click(fn=lambda: "\n".join(f"{p}: circuit {h['circuit']}, hedge after {h['hedge_delay']}s" for p, h in ProviderHealth.snapshot().items()), inputs=[], outputs=[provider_health])
+        refresh_cache.click(fn=lambda: ", ".join(f"{k}: {v}" for k, v in ResponseCache.shared().stats().items()), inputs=[], outputs=[cache_stats])
 
     return app
 
-# Launch the app (no share=True, whitelisted via no_proxy)
+# Prometheus metrics, served next to the UI at /metrics
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# Launch the app (no share=True, whitelisted via no_proxy) with /metrics mounted alongside
 if __name__ == "__main__":
-    build_ui().launch(
-        server_port=7633,
-        server_name=hostname,
-        debug=False,
-        show_api=False,
-        inbrowser=True
-    )
\ No newline at end of file
+    server = FastAPI()
+    server.add_api_route("/metrics", metrics_endpoint, methods=["GET"])
+    app = build_ui().queue(
+        default_concurrency_limit=int(get_env_variable("GRADIO_CONCURRENCY", "8")),
+        max_size=int(get_env_variable("GRADIO_QUEUE_SIZE", "0")) or None,
+    )
+    gr.mount_gradio_app(server, app, path="", show_api=False)
+    threading.Thread(target=OllamaModels.preload_configured, daemon=True).start()
+    threading.Timer(2.0, webbrowser.open, [f"http://{hostname}:7633"]).start()
+    uvicorn.run(server, host=hostname, port=7633, log_level="warning")
@@ -0,0 +1,41 @@
+import asyncio
+
+from utils.errors import ServerError
+from utils.hedge import CircuitBreaker, HedgedStream, ProviderHealth
+from utils.stream import AsyncTokenStream
+
+
+def stream(text, delay=0.0, error=None):
+    async def deltas():
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        yield text
+    return AsyncTokenStream(deltas())
+
+
+def race(candidates):
+    async def run():
+        hedged = HedgedStream(candidates)
+        text = await hedged.read()
+        return hedged.provider, text
+    return asyncio.run(run())
+
+
+def test_cancelled_trial_is_released(monkeypatch):
+    monkeypatch.setenv("HEDGE_DEFAULT_DELAY", "0.01")
+    breaker = ProviderHealth._breakers["trial-a"] = CircuitBreaker("trial-a", failure_threshold=1, reset_seconds=0.0)
+    ProviderHealth._breakers["trial-b"] = CircuitBreaker("trial-b")
+
+    # Open trial-a's circuit; with no cooldown it is half-open straight away
+    assert race([("trial-a", lambda: stream("", error=ServerError("down"))), ("trial-b", lambda: stream("b"))]) == ("trial-b", "b")
+    assert breaker.state == "half-open"
+
+    # trial-a gets the trial request but is slow, so it loses the hedge race and is cancelled
+    assert race([("trial-a", lambda: stream("a", delay=1.0)), ("trial-b", lambda: stream("b"))]) == ("trial-b", "b")
+    assert breaker.allow()  # the cancelled trial does not block the next one
+    breaker.release_trial()
+
+    # A later race tries trial-a again, and its success closes the circuit
+    assert race([("trial-a", lambda: stream("a")), ("trial-b", lambda: stream("b", delay=1.0))]) == ("trial-a", "a")
+    assert breaker.state == "closed"
@@ -0,0 +1 @@
+from utils.config import Config
@@ -1,129 +1,560 @@
+import os
+import copy
+import time
+import sys
+import asyncio
 import requests
 import logging
-import base64
 import json
-from io import BytesIO
-from PIL import Image
+import hashlib
+from utils import metrics
+from utils.cache import ResponseCache, cache_key
+from utils.errors import APIError, ClientError, MalformedResponseError, RateLimitError, RetryableError, ServerError, TransportError
+from utils.image import Img, mime_from_base64
+from utils.ratelimit import RateLimiter, parse_retry_after, retry_delay
+from utils.stream import TokenStream, AsyncTokenStream, iter_sse, aiter_sse, iter_ndjson, aiter_ndjson
+from utils.tokens import IMAGE_TOKENS, count_tokens, max_output_tokens
+from utils.transport import Transport, AsyncTransport
+
+
+def provider_name(url):
+    """Name the OpenAI-compatible provider behind a chat completions URL."""
+    return "openrouter" if "openrouter" in (url or "") else "openai"
+
+
+def status_error(provider, status, body="", retry_after=None):
+    """Typed error for an HTTP error status from a provider."""
+    message = f"{provider} returned HTTP {status}: {body[:500]}".strip()
+    if status == 429:
+        return RateLimitError(message, provider, status, retry_after)
+    if status >= 500 or status == 408:
+        return ServerError(message, provider, status, retry_after)
+    return ClientError(message, provider, status)
+
+
+def pull_event(event):
+    """An Ollama /api/pull progress line, with percent added while a layer downloads."""
+    if event.get("error"):
+        raise ClientError(f"ollama: {event['error']}", "ollama")
+    if event.get("total"):
+        event["percent"] = round(100 * event.get("completed", 0) / event["total"], 1)
+    return event
+
+
+def translate_error(e, provider):
+    """Map a requests/httpx/parsing exception onto the utils.errors hierarchy."""
+    if isinstance(e, APIError):
+        return e
+    if isinstance(e, (json.JSONDecodeError, KeyError, IndexError)):
+        return MalformedResponseError(f"{provider}: malformed response from server ({str(e)})", provider)
+    response = getattr(e, "response", None)
+    httpx = sys.modules.get("httpx")  # imported lazily by AsyncTransport, so absent means e is not an httpx error
+    if response is not None and (isinstance(e, requests.HTTPError) or httpx and isinstance(e, httpx.HTTPStatusError)):
+        return status_error(provider, response.status_code, response.text, parse_retry_after(response.headers.get("Retry-After")))
+    if isinstance(e, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)) or httpx and isinstance(e, httpx.TransportError):
+        return TransportError(f"{provider}: {str(e) or type(e).__name__}", provider)
+    return APIError(f"{provider}: {str(e)}", provider)
+
+
+class Flight:
+    """One upstream call, pumped by its own task so callers can come and go; every caller gets all of its deltas."""
+
+    def __init__(self, deltas, release):
+        self.loop = asyncio.get_running_loop()
+        self.parts = []
+        self.error = None
+        self.done = False
+        self.callers = 0
+        self._changed = asyncio.Event()
+        self._release = release
+        self.task = asyncio.ensure_future(self._pump(deltas))
+
+    async def _pump(self, deltas):
+        try:
+            async for delta in deltas:
+                self.parts.append(delta)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        except asyncio.CancelledError:
+            self.error = APIError("Shared upstream call was cancelled before it completed")  # never a clean end
+            raise
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self):
+        """Deltas received so far, then new ones as they arrive; re-raises the upstream error."""
+        self.callers += 1
+        sent = 0
+        try:
+            while True:
+                changed = self._changed
+                while sent < len(self.parts):
+                    yield self.parts[sent]
+                    sent += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await changed.wait()
+        finally:
+            self.callers -= 1
+            if not self.callers and not self.done:
+                self._release()  # unjoinable from now on, not only once the task has ended
+                self.task.cancel()  # everyone left, stop generating
+
+
+class SingleFlight:
+    """Coalesces identical in-flight async requests: later callers attach to the first caller's upstream stream."""
+    _flights = {}
+
+    @staticmethod
+    def enabled():
+        return os.getenv("REQUEST_COALESCING_ENABLED", "true").lower() == "true"
+
+    @classmethod
+    def _drop(cls, key, flight):
+        if cls._flights.get(key) is flight:
+            del cls._flights[key]
+
+    @classmethod
+    async def join(cls, key, make_deltas, call):
+        flight = cls._flights.get(key)
+        if flight is None or flight.done or flight.loop is not asyncio.get_running_loop():
+            flight = cls._flights[key] = Flight(make_deltas(), lambda: cls._drop(key, flight))
+            flight.task.add_done_callback(lambda _: cls._drop(key, flight))
+        else:
+            call["coalesced"] = True
+        async for delta in flight.follow():
+            yield delta
+
 
 class API:
-    def __init__(self, key=None, url=None, model=None, token_limit=2048, temp=0.7, top_p=0.9):
+    def __init__(self, key=None, url=None, model=None, token_limit=2048, temp=0.7, top_p=0.9, use_cache=True, detail="high", keep_alive=None):
         self.key = key
         self.url = url
         self.model = model
         self.token_limit = token_limit
         self.temp = temp
         self.top_p = top_p
+        self.use_cache = use_cache
+        self.detail = detail
+        self.keep_alive = keep_alive
+        self.provider = provider_name(url)
+        self.stage = None
+        self.json_output = False
+        self.validate = None
 
-    def req(self, prompt, img_data=None):
-        """Send a request to the API, with optional image data."""
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.key}"
-        }
+    def for_stage(self, stage):
+        """Copy of this API whose calls are labeled with a pipeline stage in metrics."""
+        api = copy.copy(self)
+        api.stage = stage
+        return api
+
+    def structured(self, validate=None):
+        """Copy of this API that asks the provider for a JSON object reply; replies are only cached
+        once validate(text) accepts them (it raises APIError or ValueError to reject one)."""
+        api = copy.copy(self)
+        api.json_output = True
+        api.validate = validate
+        return api
+
+    def _headers(self):
+        headers = {"Content-Type": "application/json"}
+        if self.key:
+            headers["Authorization"] = f"Bearer {self.key}"
+        return headers
+
+    def _payload(self, prompt, img_data=None, stream=False):
         content = [{"type": "text", "text": prompt}]
         if img_data:
             content.append({
                 "type": "image_url",
-                "image_url": {"url": f"data:image/png;base64,{img_data}", "detail": "high"}
+                "image_url": {"url": f"data:{mime_from_base64(img_data)};base64,{img_data}", "detail": self.detail}
             })
         payload = {
             "model": self.model,
             "messages": [{"role": "user", "content": content}],
-            "max_tokens": self.token_limit,
+            "max_tokens": self._max_tokens(self.provider, prompt, 1 if img_data else 0),
             "temperature": self.temp,
             "top_p": self.top_p
         }
+        if stream:
+            payload["stream"] = True
+        if self.json_output:
+            payload["response_format"] = {"type": "json_object"}
+        return payload
+
+    def _max_tokens(self, provider, prompt, images=0):
+        """token_limit, capped by what the model's context window leaves after the prompt and images."""
+        used = count_tokens(prompt, self.model) + images * IMAGE_TOKENS.get(self.detail, IMAGE_TOKENS["high"])
+        return max_output_tokens(provider, self.model, used, self.token_limit)
+
+    def _token_estimate(self, prompt, max_tokens=0):
+        """Token cost of a request for the tokens/min limit."""
+        return count_tokens(prompt, self.model) + int(max_tokens or 0)
+
+    @staticmethod
+    def _encode_image(image):
+        """Convert a Gradio image (PIL object or file path) to Base64 for Ollama."""
+        return Img.preprocess(image, **Img.settings("ollama"))
+
+    # Response cache
+
+    def _cache(self):
+        return ResponseCache.shared() if self.use_cache else None
+
+    def _cacheable(self, text):
+        if self.validate is None:
+            return True
+        try:
+            self.validate(text)
+        except (APIError, ValueError):
+            return False
+        return True
+
+    def _key(self, url, prompt, image=None):
+        return cache_key(url, self.model, prompt, self.temp, self.top_p, self.token_limit, image, self.detail if image else None, self.json_output)
+
+    def _ollama_key(self, payload):
+        images = payload.get("images") or [None]
+        return self._key(f"{self.url}/api/generate", payload["prompt"], images[0])
+
+    def _with_cache(self, key, deltas, call):
+        """Replay a cached response, or pass deltas through and store them once the stream completes."""
+        cache = self._cache()
+        cached = cache.get(key) if cache else None
+        if cached:
+            call["cached"] = True
+            yield cached
+            return
+        parts = []
+        for delta in deltas:
+            parts.append(delta)
+            yield delta
+        if cache and parts and self._cacheable("".join(parts)):  # never replay an empty or invalid reply
+            cache.put(key, "".join(parts))
+
+    async def _awith_cache(self, key, deltas, call):
+        """Async variant of _with_cache()."""
+        cache = self._cache()
+        cached = cache.get(key) if cache else None
+        if cached:
+            call["cached"] = True
+            yield cached
+            return
+        parts = []
+        async for delta in deltas:
+            parts.append(delta)
+            yield delta
+        if cache and parts and self._cacheable("".join(parts)):  # never replay an empty or invalid reply
+            cache.put(key, "".join(parts))
+
+    def _coalesced(self, key, make_deltas, call):
+        """Share the upstream call with identical requests already in flight (async callers only)."""
+        if not SingleFlight.enabled():
+            return make_deltas()
+        # Callers only share calls made with the same credentials: a key's errors and billing stay its own
+        credential = hashlib.sha256(self.key.encode("utf-8")).hexdigest() if self.key else None
+        return SingleFlight.join((key, credential), make_deltas, call)
+
+    # Instrumentation: latency, time to first token, throughput, sizes and errors per call
+
+    def _record(self, provider, call, started, first, parts, request_bytes, error=None):
+        text = "".join(parts)
+        streamed = len(parts) > 1  # a single delta (req/areq) has no real first token or token rate
+        metrics.observe_call(
+            self.stage, provider, self.model, time.perf_counter() - started,
+            ttft=first - started if streamed else None,
+            tokens=len(parts) if streamed else len(text) // 4,
+            request_bytes=request_bytes, response_bytes=len(text.encode("utf-8")),
+            error=error, cached=call.get("cached", False), coalesced=call.get("coalesced", False),
+        )
+
+    def _observed(self, provider, request_bytes, make_deltas):
+        call = {}
+        started, first, parts = time.perf_counter(), None, []
         try:
-            response = requests.post(self.url, headers=headers, json=payload)
+            for delta in make_deltas(call):
+                if first is None:
+                    first = time.perf_counter()
+                parts.append(delta)
+                yield delta
+        except APIError as e:
+            self._record(provider, call, started, first, parts, request_bytes, type(e).__name__)
+            raise
+        self._record(provider, call, started, first, parts, request_bytes)
+
+    async def _aobserved(self, provider, request_bytes, make_deltas):
+        """Async variant of _observed()."""
+        call = {}
+        started, first, parts = time.perf_counter(), None, []
+        try:
+            async for delta in make_deltas(call):
+                if first is None:
+                    first = time.perf_counter()
+                parts.append(delta)
+                yield delta
+        except APIError as e:
+            self._record(provider, call, started, first, parts, request_bytes, type(e).__name__)
+            raise
+        self._record(provider, call, started, first, parts, request_bytes)
+
+    # Error handling: transport, status and parse failures are raised as utils.errors types
+
+    @staticmethod
+    def _guard(deltas, provider):
+        try:
+            yield from deltas
+        except (requests.RequestException, json.JSONDecodeError, KeyError, IndexError) as e:
+            raise translate_error(e, provider) from e
+
+    @staticmethod
+    async def _aguard(deltas, provider):
+        import httpx
+        try:
+            async for delta in deltas:
+                yield delta
+        except (httpx.HTTPError, json.JSONDecodeError, KeyError, IndexError) as e:
+            raise translate_error(e, provider) from e
+
+    # Rate limiting and retries: retryable failures are retried until the first delta has been yielded
+
+    @staticmethod
+    def _backoff(limiter, e, attempt):
+        metrics.RETRIES.inc(provider=limiter.name, error=type(e).__name__)
+        if isinstance(e, RateLimitError) and e.retry_after:
+            limiter.pause(e.retry_after)
+        delay = retry_delay(attempt, e.retry_after)
+        logging.warning(f"{str(e)}; retry {attempt + 1} in {delay:.2f}s")
+        return delay
+
+    def _retrying(self, provider, tokens, attempt):
+        limiter = RateLimiter.for_provider(provider)
+        max_retries = int(os.getenv("API_MAX_RETRIES", "3"))
+        for n in range(max_retries + 1):
+            limiter.acquire(tokens)
+            streamed = False
+            try:
+                for delta in self._guard(attempt(), provider):
+                    streamed = True
+                    yield delta
+                return
+            except RetryableError as e:
+                if streamed or n == max_retries:
+                    raise
+                time.sleep(self._backoff(limiter, e, n))
+
+    async def _aretrying(self, provider, tokens, attempt):
+        """Async variant of _retrying()."""
+        limiter = RateLimiter.for_provider(provider)
+        max_retries = int(os.getenv("API_MAX_RETRIES", "3"))
+        for n in range(max_retries + 1):
+            await limiter.aacquire(tokens)
+            streamed = False
+            try:
+                async for delta in self._aguard(attempt(), provider):
+                    streamed = True
+                    yield delta
+                return
+            except RetryableError as e:
+                if streamed or n == max_retries:
+                    raise
+                await asyncio.sleep(self._backoff(limiter, e, n))
+
+    # OpenAI-compatible chat completions
+
+    def _complete(self, prompt, img_data):
+        response = Transport.post(self.url, headers=self._headers(), json=self._payload(prompt, img_data))
+        response.raise_for_status()
+        yield response.json()["choices"][0]["message"]["content"].strip()
+
+    async def _acomplete(self, prompt, img_data):
+        response = await AsyncTransport.post(self.url, headers=self._headers(), json=self._payload(prompt, img_data))
+        response.raise_for_status()
+        yield response.json()["choices"][0]["message"]["content"].strip()
+
+    def _sse_deltas(self, prompt, img_data):
+        with Transport.post(self.url, headers=self._headers(), json=self._payload(prompt, img_data, stream=True), stream=True) as response:
+            if not response.ok:
+                response.content  # read the error body while the stream is still open
             response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"].strip()
-        except requests.RequestException as e:
-            logging.error(f"API error: {str(e)}")
-            return f"Error: {str(e)}"
+            yield from iter_sse(response.iter_lines())
 
-    def ollama_analyze_image(self, image):
-        """Analyze an image using Ollama's model, handling a Gradio Image object."""
+    async def _asse_deltas(self, prompt, img_data):
+        async with AsyncTransport.stream(self.url, headers=self._headers(), json=self._payload(prompt, img_data, stream=True)) as response:
+            if response.is_error:
+                await response.aread()
+            response.raise_for_status()
+            async for delta in aiter_sse(response.aiter_lines()):
+                yield delta
+
+    def _chat(self, prompt, img_data, attempt):
+        tokens = self._token_estimate(prompt, self.token_limit)
+        key = self._key(self.url, prompt, img_data)
+        return self._observed(self.provider, len(prompt) + len(img_data or ""), lambda call: self._with_cache(
+            key, self._retrying(self.provider, tokens, lambda: attempt(prompt, img_data)), call))
+
+    def _achat(self, prompt, img_data, attempt):
+        tokens = self._token_estimate(prompt, self.token_limit)
+        key = self._key(self.url, prompt, img_data)
+        return self._aobserved(self.provider, len(prompt) + len(img_data or ""), lambda call: self._coalesced(
+            key, lambda: self._awith_cache(key, self._aretrying(self.provider, tokens, lambda: attempt(prompt, img_data)), call), call))
+
+    def req(self, prompt, img_data=None):
+        """Send a request to the API, with optional image data. Raises utils.errors.APIError on failure."""
+        return "".join(self._chat(prompt, img_data, self._complete))
+
+    async def areq(self, prompt, img_data=None):
+        """Async variant of req() sharing the process-wide keep-alive pool."""
+        return "".join([delta async for delta in self._achat(prompt, img_data, self._acomplete)])
+
+    def stream(self, prompt, img_data=None):
+        """Stream completion tokens from the API as a TokenStream of text deltas."""
+        return TokenStream(self._chat(prompt, img_data, self._sse_deltas))
+
+    def astream(self, prompt, img_data=None):
+        """Async variant of stream(); consume with 'async for'."""
+        return AsyncTokenStream(self._achat(prompt, img_data, self._asse_deltas))
+
+    # Ollama
+
+    def _ollama_deltas(self, payload):
+        """POST an Ollama /api/generate payload and yield the streamed response fields."""
         generate_url = f"{self.url}/api/generate"
+        with Transport.post(generate_url, headers={"Content-Type": "application/json"}, json=payload, stream=True) as response:
+            if not response.ok:
+                response.content  # read the error body while the stream is still open
+            response.raise_for_status()
+            yield from iter_ndjson(response.iter_lines())
 
-        # Convert the Gradio Image object to Base64
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")  # Ensure PNG format; change to "JPEG" if needed
-        base64_image = base64.b64encode(buffered.getvalue()).decode("utf-8")
-        
-        vision_payload = {
-            "model": self.model,
-            "prompt": "Analyze the image, focusing on specific objects, body types, colors, textures, gender expressions...",
-            "images": [base64_image],
-            "stream": True
-        }
-        
+    async def _aollama_deltas(self, payload):
+        """Async variant of _ollama_deltas()."""
+        generate_url = f"{self.url}/api/generate"
+        async with AsyncTransport.stream(generate_url, headers={"Content-Type": "application/json"}, json=payload) as response:
+            if response.is_error:
+                await response.aread()
+            response.raise_for_status()
+            async for delta in aiter_ndjson(response.aiter_lines()):
+                yield delta
+
+    def _keep_alive(self):
+        """How long Ollama keeps the model loaded: this API's value or OLLAMA_KEEP_ALIVE; bare numbers are seconds."""
+        value = self.keep_alive if self.keep_alive is not None else os.getenv("OLLAMA_KEEP_ALIVE", "")
         try:
-            response = requests.post(generate_url, headers={"Content-Type": "application/json"}, json=vision_payload, stream=True)
-            analysis_result = ""
-            
-            if response.status_code == 200:
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            json_line = json.loads(line)
-                            analysis_result += json_line.get("response", "")
-                        except json.JSONDecodeError:
-                            return "Error: Malformed JSON from server."
-                return analysis_result
-            else:
-                return f"Error: Server returned {response.status_code}. Response: {response.text}"
-        except requests.RequestException as e:
-            logging.error(f"Ollama API error: {str(e)}")
-            return f"Error: {str(e)}"
+            return int(value)
+        except ValueError:
+            return value or None
+
+    def _ollama_payload(self, **fields):
+        payload = {"model": self.model, **fields, "stream": True}
+        options = {"num_predict": self._max_tokens("ollama", fields["prompt"], len(fields.get("images", ())))}
+        if os.getenv("OLLAMA_CONTEXT_WINDOW"):
+            options["num_ctx"] = int(os.getenv("OLLAMA_CONTEXT_WINDOW"))  # make the server use the window we budget for
+        payload["options"] = options
+        if self.json_output:
+            payload["format"] = "json"
+        keep_alive = self._keep_alive()
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        return payload
+
+    def _vision_payload(self, base64_image):
+        return self._ollama_payload(
+            prompt="Analyze the image, focusing on specific objects, body types, colors, textures, gender expressions...",
+            images=[base64_image],
+        )
+
+    def _text_payload(self, prompt):
+        return self._ollama_payload(prompt=prompt)
+
+    def _ollama_bytes(self, payload):
+        return len(payload["prompt"]) + sum(len(image) for image in payload.get("images", ()))
+
+    def _ollama_stream(self, payload):
+        tokens = self._token_estimate(payload["prompt"])
+        return TokenStream(self._observed("ollama", self._ollama_bytes(payload), lambda call: self._with_cache(
+            self._ollama_key(payload), self._retrying("ollama", tokens, lambda: self._ollama_deltas(payload)), call)))
+
+    def _aollama_generate(self, payload):
+        tokens = self._token_estimate(payload["prompt"])
+        key = self._ollama_key(payload)
+        return self._aobserved("ollama", self._ollama_bytes(payload), lambda call: self._coalesced(
+            key, lambda: self._awith_cache(key, self._aretrying("ollama", tokens, lambda: self._aollama_deltas(payload)), call), call))
+
+    async def _aollama_image_deltas(self, image):
+        base64_image = await asyncio.to_thread(self._encode_image, image)
+        async for delta in self._aollama_generate(self._vision_payload(base64_image)):
+            yield delta
+
+    def ollama_stream_image(self, image):
+        """Stream an Ollama image analysis as a TokenStream of text deltas."""
+        return self._ollama_stream(self._vision_payload(self._encode_image(image)))
+
+    def aollama_stream_image(self, image):
+        """Async variant of ollama_stream_image()."""
+        return AsyncTokenStream(self._aollama_image_deltas(image))
+
+    def ollama_stream_completion(self, prompt):
+        """Stream an Ollama text completion as a TokenStream of text deltas."""
+        return self._ollama_stream(self._text_payload(prompt))
+
+    def aollama_stream_completion(self, prompt):
+        """Async variant of ollama_stream_completion()."""
+        return AsyncTokenStream(self._aollama_generate(self._text_payload(prompt)))
+
+    def ollama_analyze_image(self, image):
+        """Analyze an image using Ollama's model, handling a Gradio Image object."""
+        return self.ollama_stream_image(image).read()
+
+    async def aollama_analyze_image(self, image):
+        """Async variant of ollama_analyze_image()."""
+        return await self.aollama_stream_image(image).read()
 
     def ollama_generate_completion(self, prompt):
         """Generate text completion using Ollama's prompt model."""
-        generate_url = f"{self.url}/api/generate"
-        text_payload = {
-            "model": self.model,
-            "prompt": prompt,
-            "stream": True
-        }
-        
-        try:
-            response = requests.post(generate_url, headers={"Content-Type": "application/json"}, json=text_payload, stream=True)
-            completion_result = ""
-            
-            if response.status_code == 200:
+        return self.ollama_stream_completion(prompt).read()
+
+    async def aollama_generate_completion(self, prompt):
+        """Async variant of ollama_generate_completion()."""
+        return await self.aollama_stream_completion(prompt).read()
+
+    def pull_progress(self, model_name):
+        """Pull a model, yielding Ollama's progress events (status, and completed/total bytes and percent per layer)."""
+        pull_url = f"{self.url}/api/pull"
+
+        def attempt():
+            with Transport.post(pull_url, headers={"Content-Type": "application/json"}, json={"name": model_name}, stream=True) as response:
+                if not response.ok:
+                    response.content  # read the error body while the stream is still open
+                response.raise_for_status()
                 for line in response.iter_lines():
                     if line:
-                        try:
-                            json_line = json.loads(line)
-                            completion_result += json_line.get("response", "")
-                        except json.JSONDecodeError:
-                            return "Error: Malformed JSON from server."
-                return completion_result
-            else:
-                return f"Error: Server returned {response.status_code}. Response: {response.text}"
-        except requests.RequestException as e:
-            logging.error(f"Ollama API error: {str(e)}")
-            return f"Error: {str(e)}"
+                        yield pull_event(json.loads(line))
 
-    def pull_model(self, model_name):
-        """Pull model if not already available for Ollama."""
+        return self._retrying("ollama", 0, attempt)
+
+    async def apull_progress(self, model_name):
+        """Async variant of pull_progress()."""
         pull_url = f"{self.url}/api/pull"
-        pull_payload = {"name": model_name}
-        
-        try:
-            response = requests.post(pull_url, headers={"Content-Type": "application/json"}, data=json.dumps(pull_payload), stream=True)
-            pull_status = ""
-            
-            if response.status_code == 200:
-                for line in response.iter_lines():
+
+        async def attempt():
+            async with AsyncTransport.stream(pull_url, headers={"Content-Type": "application/json"}, json={"name": model_name}) as response:
+                if response.is_error:
+                    await response.aread()
+                response.raise_for_status()
+                async for line in response.aiter_lines():
                     if line:
-                        try:
-                            json_line = json.loads(line)
-                            pull_status += json_line.get("status", "") + "\n"
-                        except json.JSONDecodeError:
-                            return "Error: Malformed JSON from server during model pull."
-                return pull_status
-            else:
-                return f"Error: Server returned {response.status_code} while pulling model. Response: {response.text}"
-        except requests.RequestException as e:
-            logging.error(f"Ollama model pull error: {str(e)}")
-            return f"Error: {str(e)}"
+                        yield pull_event(json.loads(line))
+
+        async for event in self._aretrying("ollama", 0, attempt):
+            yield event
+
+    def pull_model(self, model_name):
+        """Pull model if not already available for Ollama."""
+        return "".join(f"{event['status']}\n" for event in self.pull_progress(model_name) if event.get("status"))
@@ -0,0 +1,104 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from utils import metrics
+
+
+def cache_key(url, model, prompt, temp=None, top_p=None, token_limit=None, image=None, detail=None, json_output=False):
+    """Content address of a request: provider URL, model, prompt, sampling params, image hash and detail, and JSON mode."""
+    image_hash = hashlib.sha256(image.encode("utf-8")).hexdigest() if image else None
+    material = json.dumps([url, model, prompt, temp, top_p, token_limit, image_hash, detail, json_output])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed LLM response cache with size-bounded LRU eviction and a TTL."""
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @classmethod
+    def shared(cls):
+        """Process-wide cache configured from RESPONSE_CACHE_PATH / _MAX_MB / _TTL."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                default_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "responses.sqlite3")
+                cls._shared = cls(
+                    os.getenv("RESPONSE_CACHE_PATH", default_path),
+                    max_bytes=int(float(os.getenv("RESPONSE_CACHE_MAX_MB", "64")) * 1024 * 1024),
+                    ttl=float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600))),
+                )
+            return cls._shared
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.misses += 1
+                metrics.CACHE.inc(result="miss")
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            metrics.CACHE.inc(result="hit")
+            return row[0]
+
+    def put(self, key, value):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+        total = sum(size for _, size in rows)
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", stale)
+        logging.info(f"Response cache evicted {len(stale)} entries")
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import base64
+import logging
+import threading
+from urllib.parse import urlsplit
+from dotenv import dotenv_values
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# static_config.json keys that seed settings of the same meaning (lowest precedence)
+STATIC_KEYS = {
+    ("generation", "temperature"): "TEMPERATURE",
+    ("generation", "top_p"): "TOP_P",
+    ("generation", "token_limit"): "TOKEN_LIMIT",
+    ("art_styles",): "ART_STYLES",
+}
+
+
+class ConfigError(ValueError):
+    """A setting is missing its expected type or range."""
+
+
+def _number(kind, low=None, high=None):
+    def parse(name, value):
+        try:
+            number = kind(value)
+        except (TypeError, ValueError):
+            raise ConfigError(f"{name} must be a{'n integer' if kind is int else ' number'}, got {value!r}")
+        if (low is not None and number < low) or (high is not None and number > high):
+            raise ConfigError(f"{name} must be between {low} and {high}, got {number}")
+        return number
+    return parse
+
+
+def _url(name, value):
+    parts = urlsplit(value)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        raise ConfigError(f"{name} must be an http(s) URL, got {value!r}")
+    return value
+
+
+def _flag(name, value):
+    if str(value).lower() in ("1", "true", "yes", "on"):
+        return True
+    if str(value).lower() in ("0", "false", "no", "off", ""):
+        return False
+    raise ConfigError(f"{name} must be true or false, got {value!r}")
+
+
+# Typed settings: name -> (parser, default)
+SCHEMA = {
+    "TEMPERATURE": (_number(float, 0.0, 2.0), 0.7),
+    "TOP_P": (_number(float, 0.0, 1.0), 0.9),
+    "TOKEN_LIMIT": (_number(int, 1), 8192),
+    "OPENAI_URL": (_url, "https://api.openai.com/v1/chat/completions"),
+    "OPENROUTER_URL": (_url, "https://openrouter.ai/api/v1/chat/completions"),
+    "OLLAMA_SERVER_URL": (_url, "http://data-tamer-01.local:11434"),
+    "HTTP_POOL_SIZE": (_number(int, 1), 16),
+    "HTTP_CONNECT_TIMEOUT": (_number(float, 0.0), 10.0),
+    "HTTP_READ_TIMEOUT": (_number(float, 0.0), 300.0),
+    "RESPONSE_CACHE_ENABLED": (_flag, True),
+    "REQUEST_COALESCING_ENABLED": (_flag, True),
+}
+
+
+class Config:
+    """Settings merged once from static_config.json, .env and the OS environment (later wins), with cached UI assets."""
+    _values = None
+    _published = {}  # values load_env wrote into os.environ, so a reload can tell them from real OS settings
+    _assets = {}
+    _lock = threading.Lock()
+    load_seconds = None
+
+    @classmethod
+    def load_env(cls, env_file=None, static_file=None, reload=False):
+        """Merge, validate and publish settings to os.environ; returns the typed settings."""
+        with cls._lock:
+            if cls._values is not None and not reload:
+                return cls._values
+            started = time.perf_counter()
+            merged = cls._static(static_file or os.path.join(ROOT_DIR, "static_config.json"))
+            merged.update({k: v for k, v in dotenv_values(env_file or os.path.join(ROOT_DIR, ".env")).items() if v is not None})
+            # The process environment takes priority, as the README documents (but not values published by an earlier load)
+            merged.update({k: v for k, v in os.environ.items() if cls._published.get(k) != v})
+            values = dict(merged)
+            for name, (parse, default) in SCHEMA.items():
+                values[name] = parse(name, merged[name]) if name in merged and merged[name] != "" else default
+            for name, value in list(cls._published.items()):
+                if name not in merged and os.environ.get(name) == value:
+                    del os.environ[name]  # removed from .env since the last load
+                    del cls._published[name]
+            for name, value in merged.items():
+                if os.environ.get(name) != value:
+                    os.environ[name] = value
+                    cls._published[name] = value
+            cls._values = values
+            cls._assets.clear()
+            cls.load_seconds = time.perf_counter() - started
+            logging.debug(f"Configuration loaded in {cls.load_seconds * 1000:.1f}ms")
+            return values
+
+    @staticmethod
+    def _static(path):
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            static = json.load(f)
+        settings = {}
+        for keys, name in STATIC_KEYS.items():
+            value = static
+            for key in keys:
+                value = value.get(key) if isinstance(value, dict) else None
+            if isinstance(value, list):
+                value = ",".join(value)
+            if value is not None:
+                settings[name] = str(value)
+        return settings
+
+    @classmethod
+    def get(cls, name, default=None):
+        """Typed value for schema settings, the raw string otherwise."""
+        value = cls.load_env().get(name)
+        return default if value is None or value == "" else value
+
+    @classmethod
+    def art_styles(cls):
+        if "art_styles" not in cls._assets:
+            styles = (style.strip() for style in cls.get("ART_STYLES", "").split(","))
+            cls._assets["art_styles"] = list(dict.fromkeys(style for style in styles if style))
+        return cls._assets["art_styles"]
+
+    @classmethod
+    def asset_base64(cls, name):
+        """Base64 of a file under assets/, read once."""
+        key = ("base64", name)
+        if key not in cls._assets:
+            with open(os.path.join(ROOT_DIR, "assets", name), "rb") as f:
+                cls._assets[key] = base64.b64encode(f.read()).decode("utf-8")
+        return cls._assets[key]
+
+    @classmethod
+    def text(cls, name):
+        """Contents of a text file in the repository root, read once."""
+        key = ("text", name)
+        if key not in cls._assets:
+            with open(os.path.join(ROOT_DIR, name), "r", encoding="utf-8") as f:
+                cls._assets[key] = f.read()
+        return cls._assets[key]
@@ -0,0 +1,40 @@
+class APIError(Exception):
+    """A provider request failed; retryable subclasses mark failures worth trying again."""
+    retryable = False
+
+    def __init__(self, message, provider=None, status=None):
+        super().__init__(message)
+        self.provider = provider
+        self.status = status
+
+
+class ClientError(APIError):
+    """The provider rejected the request (4xx other than 408/429): bad key, model or payload."""
+
+
+class MalformedResponseError(APIError):
+    """The provider answered with a body that could not be parsed."""
+
+
+class RetryableError(APIError):
+    retryable = True
+
+    def __init__(self, message, provider=None, status=None, retry_after=None):
+        super().__init__(message, provider, status)
+        self.retry_after = retry_after
+
+
+class RateLimitError(RetryableError):
+    """The provider answered 429; retry_after carries its Retry-After hint in seconds, if any."""
+
+
+class ServerError(RetryableError):
+    """The provider answered 5xx or 408."""
+
+
+class TransportError(RetryableError):
+    """The connection failed, timed out or was reset before a complete response arrived."""
+
+
+class QueueFullError(RetryableError):
+    """Too many requests are already waiting on this provider's client-side rate limit."""
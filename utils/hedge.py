@@ -0,0 +1,194 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import suppress
+from utils.errors import APIError, ClientError, QueueFullError
+from utils.stream import AsyncTokenStream
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single trial request through once the cooldown has passed."""
+
+    def __init__(self, name, failure_threshold=3, reset_seconds=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def release_trial(self):
+        """A request was abandoned before it succeeded or failed: let the next one be the trial."""
+        with self._lock:
+            self._trial = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logging.warning(f"Circuit for {self.name} opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
+
+class ProviderHealth:
+    """Process-wide circuit breakers and recent time-to-first-token samples per provider."""
+    _breakers = {}
+    _latencies = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def breaker(cls, provider):
+        with cls._lock:
+            if provider not in cls._breakers:
+                cls._breakers[provider] = CircuitBreaker(
+                    provider, int(os.getenv("BREAKER_FAILURES", "3")), float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+                )
+            return cls._breakers[provider]
+
+    @classmethod
+    def record_latency(cls, provider, seconds):
+        with cls._lock:
+            cls._latencies.setdefault(provider, deque(maxlen=200)).append(seconds)
+
+    @classmethod
+    def hedge_delay(cls, provider, percentile=None):
+        """Seconds to wait on a provider before hedging: its recent TTFT percentile, or HEDGE_DEFAULT_DELAY."""
+        percentile = float(percentile if percentile is not None else os.getenv("HEDGE_PERCENTILE", "95"))
+        with cls._lock:
+            samples = sorted(cls._latencies.get(provider, ()))
+        if len(samples) < 10:
+            return float(os.getenv("HEDGE_DEFAULT_DELAY", "2.0"))
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+    @classmethod
+    def snapshot(cls):
+        with cls._lock:
+            providers = set(cls._breakers) | set(cls._latencies)
+        return {p: {"circuit": cls.breaker(p).state, "hedge_delay": round(cls.hedge_delay(p), 3)} for p in sorted(providers)}
+
+
+def provider_failure(e):
+    """Whether an error is the provider's fault, i.e. worth failing over and counting against its circuit."""
+    return isinstance(e, APIError) and not isinstance(e, (ClientError, QueueFullError))
+
+
+class HedgedStream(AsyncTokenStream):
+    """Race a primary provider's stream against hedged fallbacks; the first to produce a token wins.
+
+    candidates is a list of (provider, factory) in preference order, where factory() returns an
+    AsyncTokenStream. A fallback is started when the current leader exceeds its hedge delay or fails;
+    losers are cancelled and providers with an open circuit are skipped. If every candidate fails,
+    the last error is raised; errors that are not the provider's fault (bad input, client errors,
+    a full local queue) are raised at once without failing over.
+    """
+
+    def __init__(self, candidates, percentile=None):
+        self.candidates = candidates
+        self.percentile = percentile
+        self.provider = None
+        super().__init__(self._race())
+
+    async def _race(self):
+        waiting = list(self.candidates)
+        running = {}
+        error = None
+
+        def start(provider, factory):
+            deltas = factory().__aiter__()
+            running[asyncio.ensure_future(deltas.__anext__())] = (provider, deltas, time.perf_counter())
+
+        def launch():
+            while waiting:
+                provider, factory = waiting.pop(0)
+                if ProviderHealth.breaker(provider).allow():
+                    start(provider, factory)
+                    return True
+                logging.info(f"Skipping {provider}: circuit open")
+            return False
+
+        async def cancel(task, provider, deltas):
+            task.cancel()
+            with suppress(BaseException):
+                await task
+            await deltas.aclose()
+            ProviderHealth.breaker(provider).release_trial()  # a cancelled trial proves nothing either way
+
+        if not launch():
+            start(*self.candidates[0])  # every circuit open: fail open on the primary
+        try:
+            while running:
+                leader = next(iter(running.values()))[0]
+                timeout = ProviderHealth.hedge_delay(leader, self.percentile) if waiting and len(running) == 1 else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logging.info(f"Hedging {leader} after {timeout:.2f}s")
+                    launch()
+                    continue
+                for task in done:
+                    provider, deltas, started = running.pop(task)
+                    try:
+                        first = task.result()
+                    except StopAsyncIteration:
+                        first = ""
+                    except Exception as e:
+                        await deltas.aclose()
+                        if not provider_failure(e):
+                            ProviderHealth.breaker(provider).release_trial()
+                            raise  # a bad input or a local limit fails the same way on every provider
+                        logging.warning(f"{provider} failed in fastest mode: {str(e)}")
+                        ProviderHealth.breaker(provider).record_failure()
+                        error = e
+                        if waiting and not running:
+                            launch()
+                        continue
+                    if self.provider is None:
+                        self.provider = provider
+                        ProviderHealth.breaker(provider).record_success()
+                        ProviderHealth.record_latency(provider, time.perf_counter() - started)
+                        for other, (other_provider, other_deltas, _) in list(running.items()):
+                            running.pop(other)
+                            await cancel(other, other_provider, other_deltas)
+                        winner = deltas
+                        break
+                if self.provider is not None:
+                    break
+            else:
+                raise error
+            try:
+                if first:
+                    yield first
+                async for delta in winner:
+                    yield delta
+            finally:
+                await winner.aclose()
+        finally:
+            for task, (provider, deltas, _) in list(running.items()):
+                await cancel(task, provider, deltas)
@@ -1,21 +1,98 @@
+import os
+import time
 import base64
 from io import BytesIO
-from PIL import Image
+from collections import namedtuple
 import logging
+from utils import metrics
+
+# Encoded image ready for the wire: base64 data plus what it cost to produce
+Prepared = namedtuple("Prepared", "data mime width height size encode_seconds")
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+# Leading base64 characters of each format's magic bytes
+_BASE64_SIGNATURES = {"/9j/": "image/jpeg", "UklGR": "image/webp", "iVBOR": "image/png"}
+
+
+def mime_from_base64(data):
+    """Guess the MIME type of base64 image data from its magic bytes (PNG if unknown)."""
+    for prefix, mime in _BASE64_SIGNATURES.items():
+        if data.startswith(prefix):
+            return mime
+    return "image/png"
+
 
 class Img:
     @staticmethod
-    def preprocess(img):
+    def settings(provider):
+        """Wire-format settings from IMAGE_* env vars, overridable per provider (e.g. OLLAMA_IMAGE_MAX_PIXELS)."""
+        def env(name, default):
+            return os.getenv(f"{provider.upper()}_IMAGE_{name}", os.getenv(f"IMAGE_{name}", default))
+
+        return {
+            "fmt": env("FORMAT", "JPEG").upper(),
+            "quality": int(env("QUALITY", "85")),
+            "max_pixels": int(env("MAX_PIXELS", "1000000")),
+            "detail": env("DETAIL", "high"),
+        }
+
+    @staticmethod
+    def _open(src, max_pixels):
+        """Open a path, bytes or PIL image, letting large JPEGs decode straight at a reduced scale."""
+        from PIL import Image
+        if isinstance(src, Image.Image):
+            return src
+        img = Image.open(BytesIO(src) if isinstance(src, bytes) else src)
+        w, h = img.size
+        if img.format == "JPEG" and w * h > max_pixels:
+            scale = (max_pixels / (w * h)) ** 0.5
+            img.draft("RGB", (int(w * scale), int(h * scale)))
+        return img
+
+    @staticmethod
+    def prepare(src, fmt="JPEG", quality=85, max_pixels=1_000_000, **_):
+        """Orient, downscale to the pixel budget and encode an image as base64 in the requested format."""
+        from PIL import Image, ImageOps  # deferred so headless imports stay fast
         try:
+            started = time.perf_counter()
+            img = ImageOps.exif_transpose(Img._open(src, max_pixels))
             w, h = img.size
-            mpixel = 1_000_000
-            ratio = w / h
-            new_h = int((mpixel / ratio) ** 0.5)
-            new_w = int(new_h * ratio)
-            img = img.resize((new_w, new_h), Image.LANCZOS) if w * h != mpixel else img
+            if w * h > max_pixels:
+                scale = (max_pixels / (w * h)) ** 0.5
+                img = img.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.LANCZOS, reducing_gap=3.0)
+            if fmt == "JPEG" and img.mode != "RGB":
+                if img.mode in ("RGBA", "LA", "P"):
+                    img = img.convert("RGBA")
+                    background = Image.new("RGB", img.size, (255, 255, 255))
+                    background.paste(img, mask=img.getchannel("A"))
+                    img = background
+                else:
+                    img = img.convert("RGB")
+            elif fmt == "WEBP" and img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA")
             buf = BytesIO()
-            img.save(buf, format="PNG")
-            return base64.b64encode(buf.getvalue()).decode('utf-8')
+            if fmt == "PNG":
+                img.save(buf, format="PNG")
+            else:
+                img.save(buf, format=fmt, quality=quality)
+            encoded = buf.getvalue()
+            prepared = Prepared(
+                base64.b64encode(encoded).decode('utf-8'), MIME_TYPES[fmt], img.width, img.height,
+                len(encoded), time.perf_counter() - started,
+            )
+            metrics.IMAGE_ENCODE_SECONDS.observe(prepared.encode_seconds, format=fmt)
+            metrics.IMAGE_BYTES.observe(prepared.size, format=fmt)
+            metrics.emit(
+                "image_prepared", format=fmt, width=prepared.width, height=prepared.height,
+                bytes=prepared.size, seconds=round(prepared.encode_seconds, 4),
+            )
+            return prepared
         except Exception as e:
             logging.error(f"Image error: {str(e)}")
             raise ValueError("Image processing failed.")
+
+    @staticmethod
+    def preprocess(img, **settings):
+        """Return the image as base64 ready for a vision request (see prepare())."""
+        return Img.prepare(img, **settings).data
@@ -1,5 +1,30 @@
+import os
+import json
 import logging
 
-def setup_log():
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; structured fields passed via extra={"fields": {...}} are merged in."""
+
+    def format(self, record):
+        entry = {"time": self.formatTime(record), "level": record.levelname, "logger": record.name}
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        else:
+            entry["message"] = record.getMessage()
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_log(json_lines=None):
+    if json_lines is None:
+        json_lines = os.getenv("LOG_FORMAT", "text").lower() == "json"
+    if json_lines:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        logging.basicConfig(level=logging.INFO, handlers=[handler])
+    else:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     return logging.getLogger(__name__)
@@ -0,0 +1,141 @@
+import json
+import math
+import logging
+import threading
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320)
+BYTE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000)
+
+event_log = logging.getLogger("artfusion.metrics")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(n, "")) for n in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def mean(self, **labels):
+        """Average observed value for a label set, or None before the first observation."""
+        counts, total = self._values.get(tuple(str(labels.get(n, "")) for n in self.labelnames), (None, 0.0))
+        return total / counts[-1] if counts and counts[-1] else None
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                le = "+Inf" if bound == math.inf else f"{bound:g}"
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, [('le', le)])} {count}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {counts[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+_CALL = ("stage", "provider", "model")
+
+REQUEST_SECONDS = REGISTRY.register(Histogram("artfusion_request_seconds", "End-to-end latency of an LLM call, including retries.", _CALL))
+TTFT_SECONDS = REGISTRY.register(Histogram("artfusion_time_to_first_token_seconds", "Time until the first token of an LLM call.", _CALL))
+TOKENS_PER_SECOND = REGISTRY.register(Histogram("artfusion_tokens_per_second", "Output tokens per second after the first token.", _CALL, RATE_BUCKETS))
+REQUEST_BYTES = REGISTRY.register(Histogram("artfusion_request_bytes", "Prompt plus image payload size sent per call.", _CALL, BYTE_BUCKETS))
+RESPONSE_BYTES = REGISTRY.register(Histogram("artfusion_response_bytes", "Generated text size per call.", _CALL, BYTE_BUCKETS))
+REQUESTS = REGISTRY.register(Counter("artfusion_requests_total", "LLM calls by outcome (ok, error, cache_hit, coalesced: joined an identical in-flight call).", _CALL + ("outcome",)))
+ERRORS = REGISTRY.register(Counter("artfusion_errors_total", "Failed LLM calls by error type.", _CALL + ("error",)))
+RETRIES = REGISTRY.register(Counter("artfusion_retries_total", "Retried upstream attempts by error type.", ("provider", "error")))
+CACHE = REGISTRY.register(Counter("artfusion_cache_total", "Response cache lookups by result (hit, miss).", ("result",)))
+COMPACTED_TOKENS = REGISTRY.register(Counter("artfusion_compacted_tokens_total", "Prompt input tokens removed by budget compaction.", ("input",)))
+IMAGE_ENCODE_SECONDS = REGISTRY.register(Histogram("artfusion_image_encode_seconds", "Image preparation (decode, resize, encode) time.", ("format",)))
+IMAGE_BYTES = REGISTRY.register(Histogram("artfusion_image_encoded_bytes", "Encoded image size before base64.", ("format",), BYTE_BUCKETS))
+
+
+def emit(event, **fields):
+    """Write one structured JSON log line for an event."""
+    event_log.info(json.dumps({"event": event, **fields}, default=str), extra={"fields": {"event": event, **fields}})
+
+
+def observe_call(stage, provider, model, seconds, ttft=None, tokens=0, request_bytes=0, response_bytes=0, error=None, cached=False, coalesced=False):
+    """Record one LLM call in the metrics registry and as a structured log line."""
+    labels = {"stage": stage or "other", "provider": provider, "model": model}
+    outcome = "error" if error else "cache_hit" if cached else "coalesced" if coalesced else "ok"
+    REQUESTS.inc(outcome=outcome, **labels)
+    REQUEST_BYTES.observe(request_bytes, **labels)
+    if error:
+        ERRORS.inc(error=error, **labels)
+    elif not cached and not coalesced:
+        REQUEST_SECONDS.observe(seconds, **labels)
+        RESPONSE_BYTES.observe(response_bytes, **labels)
+        if ttft is not None:
+            TTFT_SECONDS.observe(ttft, **labels)
+            if tokens > 1 and seconds > ttft:
+                TOKENS_PER_SECOND.observe((tokens - 1) / (seconds - ttft), **labels)
+    emit(
+        "llm_call", outcome=outcome, seconds=round(seconds, 4), ttft=None if ttft is None else round(ttft, 4),
+        tokens=tokens, request_bytes=request_bytes, response_bytes=response_bytes, error=error, **labels,
+    )
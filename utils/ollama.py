@@ -0,0 +1,111 @@
+import os
+import time
+import logging
+import requests
+from utils import metrics, pipeline
+from utils.api import API, translate_error
+from utils.errors import APIError
+from utils.transport import Transport, AsyncTransport
+
+
+def _tagged(model):
+    """Ollama reports untagged models as name:latest."""
+    return model if ":" in model else f"{model}:latest"
+
+
+class OllamaModels:
+    """Keeps Ollama models resident: preload with keep_alive, list loaded models and warm them before work."""
+
+    @staticmethod
+    def configured():
+        """Server URL and the distinct prompt/vision models from the environment."""
+        apis = [pipeline.provider_api("ollama", kind) for kind in ("prompt", "vision")]
+        return apis[0].url, list(dict.fromkeys(api.model for api in apis))
+
+    @staticmethod
+    def _resident(models):
+        return {_tagged(m.get("model") or m.get("name", "")) for m in models}
+
+    @staticmethod
+    def loaded(url):
+        """Models currently in memory (Ollama /api/ps): name, size, size_vram and expires_at."""
+        try:
+            response = Transport.get(f"{url}/api/ps")
+            response.raise_for_status()
+            return response.json().get("models") or []
+        except (requests.RequestException, ValueError) as e:
+            raise translate_error(e, "ollama") from e
+
+    @staticmethod
+    async def aloaded(url):
+        """Async variant of loaded()."""
+        import httpx
+        try:
+            response = await AsyncTransport.get(f"{url}/api/ps")
+            response.raise_for_status()
+            return response.json().get("models") or []
+        except (httpx.HTTPError, ValueError) as e:
+            raise translate_error(e, "ollama") from e
+
+    @staticmethod
+    def _load_payload(url, model, keep_alive):
+        # A generate request without a prompt only loads the model
+        payload = {"model": model, "stream": False}
+        keep_alive = API(url=url, model=model, keep_alive=keep_alive)._keep_alive()
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        return payload
+
+    @staticmethod
+    def _loaded_in(model, started):
+        seconds = time.perf_counter() - started
+        metrics.emit("ollama_preload", model=model, seconds=round(seconds, 3))
+        logging.info(f"Ollama model {model} loaded in {seconds:.2f}s")
+        return seconds
+
+    @classmethod
+    def preload(cls, url, model, keep_alive=None):
+        """Load a model into memory without generating; returns the load time in seconds."""
+        started = time.perf_counter()
+        try:
+            response = Transport.post(f"{url}/api/generate", json=cls._load_payload(url, model, keep_alive))
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise translate_error(e, "ollama") from e
+        return cls._loaded_in(model, started)
+
+    @classmethod
+    async def apreload(cls, url, model, keep_alive=None):
+        """Async variant of preload()."""
+        import httpx
+        started = time.perf_counter()
+        try:
+            response = await AsyncTransport.post(f"{url}/api/generate", json=cls._load_payload(url, model, keep_alive))
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise translate_error(e, "ollama") from e
+        return cls._loaded_in(model, started)
+
+    @classmethod
+    def warm(cls, url, models, keep_alive=None):
+        """Preload the models that are not resident yet; returns {model: load seconds} for those."""
+        resident = cls._resident(cls.loaded(url))
+        return {m: cls.preload(url, m, keep_alive) for m in dict.fromkeys(models) if _tagged(m) not in resident}
+
+    @classmethod
+    async def awarm(cls, url, models, keep_alive=None):
+        """Async variant of warm()."""
+        resident = cls._resident(await cls.aloaded(url))
+        return {m: await cls.apreload(url, m, keep_alive) for m in dict.fromkeys(models) if _tagged(m) not in resident}
+
+    @classmethod
+    def preload_configured(cls):
+        """Warm the configured prompt/vision models when OLLAMA_PRELOAD is set; failures are only logged."""
+        if os.getenv("OLLAMA_PRELOAD", "false").lower() != "true":
+            return {}
+        url, models = cls.configured()
+        try:
+            return cls.warm(url, models)
+        except APIError as e:
+            logging.warning(f"Ollama preload skipped: {str(e)}")
+            return {}
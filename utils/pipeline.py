@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from contextlib import suppress
+from utils import metrics
+from utils.api import API
+from utils.errors import ClientError, MalformedResponseError
+from utils.hedge import HedgedStream
+from utils.image import Img
+from utils.stream import AsyncTokenStream
+from utils.tokens import count_tokens, fit
+
+# Pipeline stages in chain order
+STAGES = ("style", "image", "artist", "generate", "sd_convert")
+
+# Provider defaults: env var prefix, default URL and default prompt/vision models
+PROVIDERS = {
+    "openai": ("OPENAI", "https://api.openai.com/v1/chat/completions", "gpt-4o", "gpt-4o-mini"),
+    "openrouter": ("OPENROUTER", "https://openrouter.ai/api/v1/chat/completions", "cohere/command-r-08-2024", "qwen/qwen-2-vl-7b-instruct"),
+    "ollama": ("OLLAMA", "http://data-tamer-01.local:11434", "hf.co/leafspark/Llama-3.2-11B-Vision-Instruct-GGUF:Q8_0", "hf.co/leafspark/Llama-3.2-11B-Vision-Instruct-GGUF:Q8_0"),
+}
+
+
+def base_prompts():
+    """Base prompts and suffixes from the environment."""
+    return {
+        "style":       os.getenv("BASE_STYLE_PROMPT", ""),
+        "image":       os.getenv("BASE_IMAGE_PROMPT", ""),
+        "image_nsfw":  os.getenv("BASE_IMAGE_NSFW_PROMPT", ""),
+        "artist":      os.getenv("BASE_ARTIST_PROMPT", ""),
+        "generate":    os.getenv("BASE_GENERATE_PROMPT", ""),
+        "sd_convert":  os.getenv("SD_CONVERT_PROMPT", ""),
+        "nsfw_append": os.getenv("NSFW_APPEND", ""),
+        "no_semantic_explanation": os.getenv("NO_SEMANTIC_EXPLANATION", ""),
+    }
+
+
+# NSFW handling function to append context when necessary
+def add_nsfw_context(prompt, nsfw):
+    prompts = base_prompts()
+    if nsfw:
+        prompt += f" {prompts['nsfw_append']}"
+    prompt += f" {prompts['no_semantic_explanation']}"
+    return prompt
+
+
+def provider_api(provider, kind="prompt", use_cache=True):
+    """Build an API for a provider's prompt or vision model from the environment."""
+    prefix, default_url, prompt_model, vision_model = PROVIDERS[provider]
+    if provider == "ollama":
+        url = os.getenv("OLLAMA_SERVER_URL", default_url)
+        default_model = os.getenv("OLLAMA_MODEL_NAME", prompt_model)
+        model = os.getenv(f"OLLAMA_{kind.upper()}_MODEL", default_model)
+        return API(url=url, model=model, token_limit=int(os.getenv("TOKEN_LIMIT", "8192")), use_cache=use_cache)
+    model = os.getenv(f"{prefix}_{kind.upper()}_MODEL", prompt_model if kind == "prompt" else vision_model)
+    return API(
+        os.getenv(f"{prefix}_API_KEY", ""), os.getenv(f"{prefix}_URL", default_url), model,
+        int(os.getenv("TOKEN_LIMIT", "8192")), float(os.getenv("TEMPERATURE", "0.7")), float(os.getenv("TOP_P", "0.9")),
+        use_cache, Img.settings(provider)["detail"],
+    )
+
+
+# Stage streams: each returns an AsyncTokenStream for the given provider
+
+def style_desc(api, provider, style, nsfw):
+    api = api.for_stage("style")
+    prompts = base_prompts()
+    if provider == "ollama":
+        return api.aollama_stream_completion(add_nsfw_context(f"{prompts['style']} {style}", nsfw))
+    return api.astream(add_nsfw_context(prompts['style'] + f" for the art style: {style}", nsfw))
+
+
+async def _image_deltas(api, prompt, img, settings):
+    img_data = await asyncio.to_thread(Img.preprocess, img, **settings) if img else None
+    async for delta in api.astream(prompt, img_data):
+        yield delta
+
+
+def image_desc(api, provider, img, nsfw):
+    api = api.for_stage("image")
+    if provider == "ollama":
+        return api.aollama_stream_image(img)
+    prompts = base_prompts()
+    prompt = prompts['image_nsfw'] if nsfw else prompts['image']
+    prompt = add_nsfw_context(prompt, nsfw)
+    return AsyncTokenStream(_image_deltas(api, prompt, img, Img.settings(provider)))
+
+
+def _stream(api, provider, prompt):
+    return api.aollama_stream_completion(prompt) if provider == "ollama" else api.astream(prompt)
+
+
+def artist_prompt(provider, style, img_desc, nsfw):
+    prompts = base_prompts()
+    img_desc = fit(img_desc, "image_desc")
+    if provider == "ollama":
+        return add_nsfw_context(f"{prompts['artist']} {style} with {img_desc}", nsfw)
+    return add_nsfw_context(prompts['artist'] + f" for style {style} and characteristics: '{img_desc}'", nsfw)
+
+
+def artist_rec(api, provider, style, img_desc, nsfw):
+    return _stream(api.for_stage("artist"), provider, artist_prompt(provider, style, img_desc, nsfw))
+
+
+def generate_prompt(provider, base_inst, style, img_desc, artist_desc, nsfw):
+    img_desc, artist_desc = fit(img_desc, "image_desc"), fit(artist_desc, "artist")
+    if provider == "ollama":
+        return add_nsfw_context(f"{base_inst} Style: {style}. Inspired by: {artist_desc}. Scene: {img_desc}.", nsfw)
+    prompt = f"""
+            Scene Description: {img_desc}
+
+            Your task is to enhance this scene so that it embodies the art style of {style} and the unique characteristics of the artist {artist_desc}. Ensure the description incorporates the following details:
+
+            - Quality: Describe the scene as if it were rendered in the highest quality possible, with attention to minute details and textures.
+            - Aesthetic Harmony: Apply the visual themes and distinct artistic methods of {artist_desc}.
+            - Artistic Style: The overall aesthetic should clearly reflect the {style} style.
+
+            Produce a detailed, cohesive prompt that integrates these aspects.
+            """
+    return add_nsfw_context(prompt, nsfw)
+
+
+def prompt_gen(api, provider, base_inst, style, img_desc, artist_desc, nsfw):
+    return _stream(api.for_stage("generate"), provider, generate_prompt(provider, base_inst, style, img_desc, artist_desc, nsfw))
+
+
+def sd_convert_prompt(provider, fusion_prompt, nsfw):
+    prompts = base_prompts()
+    fusion_prompt = fit(fusion_prompt, "prompt")
+    if provider == "ollama":
+        return add_nsfw_context(f"{prompts['sd_convert']} '{fusion_prompt}'", nsfw)
+    return add_nsfw_context(prompts['sd_convert'] + f" '{fusion_prompt}'", nsfw)
+
+
+def sd_prompt(api, provider, fusion_prompt, nsfw):
+    return _stream(api.for_stage("sd_convert"), provider, sd_convert_prompt(provider, fusion_prompt, nsfw))
+
+
+# Fused mode: artist, fusion prompt and SD prompt from one structured-output request
+
+FUSED_KEYS = ("artist", "prompt", "sd_prompt")
+
+
+def fused_prompt(base_inst, style, img_desc, nsfw):
+    prompts = base_prompts()
+    img_desc = fit(img_desc, "image_desc")
+    prompt = f"""
+            Scene Description: {img_desc}
+            Art Style: {style}
+
+            Complete the three tasks below and reply with only a JSON object with the string fields "artist", "prompt" and "sd_prompt":
+
+            - artist: {prompts['artist']} for style {style} and the scene above.
+            - prompt: {base_inst} Enhance the scene so that it embodies the {style} style and the visual themes and distinct artistic methods of that artist, described as if rendered in the highest quality possible, with attention to minute details and textures.
+            - sd_prompt: {prompts['sd_convert']} applied to your "prompt".
+            """
+    return add_nsfw_context(prompt, nsfw)
+
+
+def parse_fused(text, provider=None):
+    """The artist/prompt/sd_prompt fields of a fused reply; tolerates code fences or prose around the JSON."""
+    start, end = text.find("{"), text.rfind("}")
+    try:
+        data = json.loads(text[start:end + 1]) if start != -1 else None
+    except json.JSONDecodeError:
+        data = None
+    if not isinstance(data, dict):
+        raise MalformedResponseError(f"{provider}: fused reply is not a JSON object", provider)
+    result = {}
+    for key in FUSED_KEYS:
+        value = data.get(key)
+        if isinstance(value, list):
+            value = ", ".join(str(v) for v in value)
+        if not isinstance(value, str) or not value.strip():
+            raise MalformedResponseError(f"{provider}: fused reply has no '{key}'", provider)
+        result[key] = value.strip()
+    return result
+
+
+async def fused(api, provider, base_inst, style, img_desc, nsfw):
+    """Run artist, prompt and SD conversion as one JSON request, falling back to the staged calls if it is unusable.
+
+    Returns (result keyed by FUSED_KEYS, report) where the report compares the call with the staged path."""
+    prompt = fused_prompt(base_inst, style, img_desc, nsfw)
+    report = {"mode": "fused", "input_tokens": count_tokens(prompt, api.model)}
+    started = time.perf_counter()
+    try:
+        structured = api.for_stage("fused").structured(lambda text: parse_fused(text, provider))
+        result = parse_fused(await _stream(structured, provider, prompt).read(), provider)
+    except (MalformedResponseError, ClientError) as e:
+        logging.warning(f"Fused generation falling back to staged calls: {str(e)}")
+        report.update(mode="staged", fallback=str(e))
+        artist = await artist_rec(api, provider, style, img_desc, nsfw).read()
+        fusion = await prompt_gen(api, provider, base_inst, style, img_desc, artist, nsfw).read()
+        result = {"artist": artist, "prompt": fusion, "sd_prompt": await sd_prompt(api, provider, fusion, nsfw).read()}
+    report["seconds"] = time.perf_counter() - started
+    report["staged_input_tokens"] = sum(count_tokens(p, api.model) for p in (
+        artist_prompt(provider, style, img_desc, nsfw),
+        generate_prompt(provider, base_inst, style, img_desc, result["artist"], nsfw),
+        sd_convert_prompt(provider, result["prompt"], nsfw),
+    ))
+    label = "ollama" if provider == "ollama" else api.provider
+    means = [metrics.REQUEST_SECONDS.mean(stage=stage, provider=label, model=api.model) for stage in ("artist", "generate", "sd_convert")]
+    report["staged_seconds"] = sum(means) if None not in means else None
+    metrics.emit("fused_generation", provider=label, model=api.model, **report)
+    return result, report
+
+
+def fused_summary(report):
+    """One-line comparison of a fused run with the staged path."""
+    if report["mode"] == "staged":
+        return f"Fused reply unusable ({report['fallback']}); ran the staged calls in {report['seconds']:.1f}s."
+    saved_tokens = report["staged_input_tokens"] - report["input_tokens"]
+    line = (f"One call in {report['seconds']:.1f}s with ~{report['input_tokens']} input tokens "
+            f"(staged: ~{report['staged_input_tokens']}, saved ~{saved_tokens})")
+    if report["staged_seconds"] is not None:
+        line += f"; staged calls average {report['staged_seconds']:.1f}s here, saved ~{report['staged_seconds'] - report['seconds']:.1f}s"
+    return line + "."
+
+
+def hedged(apis, order, build, *inputs, percentile=None):
+    """Race one stage across providers (primary first, then hedges) as a HedgedStream."""
+    names = list(dict.fromkeys(order))
+    return HedgedStream([(name, lambda name=name: build(apis[name], name, *inputs)) for name in names], percentile)
+
+
+# Style sweep: one image description fanned out across many styles
+
+def sweep_concurrency(provider):
+    """Requests a sweep keeps in flight per provider: SWEEP_CONCURRENCY_<PROVIDER>, default 4 (Ollama 1)."""
+    return int(os.getenv(f"SWEEP_CONCURRENCY_{provider.upper()}", "1" if provider == "ollama" else "4"))
+
+
+async def sweep(api, provider, base_inst, styles, img_desc, nsfw, concurrency=None):
+    """Style description, artist and artistic prompt for every style, at most `concurrency` requests at once.
+
+    Yields one row per style as it finishes (style, style_desc, artist, prompt, seconds, error); closing the
+    generator cancels the styles still running."""
+    semaphore = asyncio.Semaphore(concurrency or sweep_concurrency(provider))
+
+    async def call(build, *inputs):
+        async with semaphore:
+            return await build(api, provider, *inputs).read()
+
+    async def run(style):
+        row = {"style": style, "style_desc": "", "artist": "", "prompt": "", "error": None}
+        started = time.perf_counter()
+        # The style description is independent of the artist -> prompt chain, so it runs alongside
+        description = asyncio.ensure_future(call(style_desc, style, nsfw))
+        try:
+            row["artist"] = await call(artist_rec, style, img_desc, nsfw)
+            row["prompt"] = await call(prompt_gen, base_inst, style, img_desc, row["artist"], nsfw)
+            row["style_desc"] = await description
+        except Exception as e:  # one style failing (provider error, bad reply, any bug) must not end the sweep
+            logging.error(f"Sweep of {style} failed: {str(e)}")
+            row["error"] = str(e) or type(e).__name__
+        finally:
+            description.cancel()
+            with suppress(BaseException):
+                await description  # consume its outcome so a failure is not reported as never retrieved
+        row["seconds"] = time.perf_counter() - started
+        return row
+
+    tasks = [asyncio.ensure_future(run(style)) for style in dict.fromkeys(styles)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,119 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from utils.errors import QueueFullError
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff for the given attempt, never shorter than the server's Retry-After."""
+    base = float(os.getenv("API_RETRY_BASE", "0.5"))
+    cap = float(os.getenv("API_RETRY_MAX", "30"))
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after) if retry_after is not None else delay
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at per_minute; reservations may go into debt so callers queue in order."""
+
+    def __init__(self, per_minute, burst_seconds=10.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """Take amount tokens and return how many seconds the caller must wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= min(amount, self.capacity)
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+
+class RateLimiter:
+    """Per-provider requests/min and tokens/min limits shared by every session in the process."""
+    _limiters = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, name, rpm=0, tpm=0, max_queue=64):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_provider(cls, name):
+        """Shared limiter configured from <NAME>_RPM, <NAME>_TPM and RATE_LIMIT_QUEUE (0 = unlimited)."""
+        with cls._registry_lock:
+            if name not in cls._limiters:
+                prefix = name.upper()
+                cls._limiters[name] = cls(
+                    name,
+                    rpm=float(os.getenv(f"{prefix}_RPM", "0")),
+                    tpm=float(os.getenv(f"{prefix}_TPM", "0")),
+                    max_queue=int(os.getenv("RATE_LIMIT_QUEUE", "64")),
+                )
+            return cls._limiters[name]
+
+    def pause(self, seconds):
+        """Hold every caller back, e.g. after the provider answered 429 with Retry-After."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def _reserve(self, tokens):
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                raise QueueFullError(f"{self.name}: {self.waiting} requests already queued", provider=self.name)
+            wait = self.blocked_until - time.monotonic()
+        if self.requests:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def acquire(self, tokens=0):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            logging.info(f"Rate limit: {self.name} request queued for {wait:.2f}s")
+            with self._lock:
+                self.waiting += 1
+            try:
+                time.sleep(wait)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+
+    async def aacquire(self, tokens=0):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            logging.info(f"Rate limit: {self.name} request queued for {wait:.2f}s")
+            with self._lock:
+                self.waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
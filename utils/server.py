@@ -0,0 +1,239 @@
+import os
+import time
+import base64
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+from utils import Config, metrics, pipeline
+from utils.errors import APIError, ClientError, QueueFullError, RateLimitError
+from utils.ollama import OllamaModels
+from utils.transport import AsyncTransport, Transport
+
+
+class StageLimit:
+    """Per-stage concurrency cap with a bounded wait queue; callers beyond it are rejected with QueueFullError."""
+
+    def __init__(self, name, concurrency, max_queue):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    @asynccontextmanager
+    async def slot(self, admit=True):
+        """Hold one of the stage's slots; admit=False waits even when the queue is full (stages inside a chain)."""
+        if admit and self._semaphore.locked() and self.waiting >= self.max_queue:
+            raise QueueFullError(f"{self.name} queue is full ({self.waiting} waiting)", "server")
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def snapshot(self):
+        return {"concurrency": self.concurrency, "active": self.active, "waiting": self.waiting, "max_queue": self.max_queue}
+
+
+class StageRequest(BaseModel):
+    provider: str = ""
+    nsfw: bool = False
+    use_cache: bool = Field(default_factory=lambda: Config.get("RESPONSE_CACHE_ENABLED"))
+
+
+class StyleRequest(StageRequest):
+    style: str
+
+
+class ImageRequest(StageRequest):
+    image: str  # base64, optionally as a data: URI
+
+
+class ArtistRequest(StageRequest):
+    style: str
+    image_desc: str
+
+
+class GenerateRequest(StageRequest):
+    style: str
+    image_desc: str
+    artist_desc: str
+    base_instruction: str = ""
+
+
+class SDRequest(StageRequest):
+    fusion_prompt: str
+
+
+class ChainRequest(StageRequest):
+    style: str
+    image: str
+    vision_provider: str = ""
+    base_instruction: str = ""
+    sd: bool = True
+    fused: bool = False  # artist, prompt and SD prompt in one JSON request
+
+
+def decode_image(data):
+    if data.startswith("data:"):
+        data = data.partition(",")[2]
+    try:
+        return base64.b64decode(data, validate=True)
+    except ValueError:
+        raise ValueError("image must be base64-encoded")
+
+
+def _status(e):
+    if isinstance(e, (QueueFullError, RateLimitError)):
+        return 429
+    return 502
+
+
+def create_app():
+    """Headless JSON API over the pipeline stages; limits and timeouts come from API_SERVER_* env vars."""
+    Config.load_env()
+    Transport.configure(
+        pool_size=os.getenv("HTTP_POOL_SIZE", Transport.pool_size),
+        connect_timeout=os.getenv("HTTP_CONNECT_TIMEOUT", Transport.connect_timeout),
+        read_timeout=os.getenv("HTTP_READ_TIMEOUT", Transport.read_timeout),
+    )
+    concurrency = int(os.getenv("API_SERVER_CONCURRENCY", "8"))
+    max_queue = int(os.getenv("API_SERVER_QUEUE", "32"))
+    timeout = float(os.getenv("API_SERVER_TIMEOUT", "120"))
+    chain_timeout = float(os.getenv("API_SERVER_CHAIN_TIMEOUT", "300"))
+    default_provider = os.getenv("API_SERVER_PROVIDER", "openai")
+    default_vision = os.getenv("API_SERVER_VISION_PROVIDER", default_provider)
+    limits = {
+        name: StageLimit(name, int(os.getenv(f"API_SERVER_CONCURRENCY_{name.upper()}", concurrency)), max_queue)
+        for name in pipeline.STAGES + ("chain",)
+    }
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await asyncio.to_thread(OllamaModels.preload_configured)
+        yield
+        await AsyncTransport.close()
+        Transport.close()
+
+    app = FastAPI(title="Art Style Fusion API", lifespan=lifespan)
+
+    @app.exception_handler(APIError)
+    async def api_error(request, e):
+        status = _status(e)
+        headers = {"Retry-After": str(max(1, round(getattr(e, "retry_after", None) or 1)))} if status == 429 else {}
+        if not isinstance(e, (QueueFullError, ClientError)):
+            logging.error(f"{request.url.path} failed: {str(e)}")
+        return JSONResponse({"error": str(e), "provider": e.provider}, status_code=status, headers=headers)
+
+    @app.exception_handler(ValueError)
+    async def bad_input(request, e):
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    @app.exception_handler(asyncio.TimeoutError)
+    async def timed_out(request, e):
+        return JSONResponse({"error": f"{request.url.path} timed out"}, status_code=504)
+
+    def provider_of(body, default):
+        provider = body.provider or default
+        if provider not in pipeline.PROVIDERS:
+            raise ValueError(f"unknown provider '{provider}'")
+        return provider
+
+    async def run_stage(stage, provider, kind, use_cache, build, *inputs, admit=True):
+        """Run one stage under its limit and return (text, timing)."""
+        async with limits[stage].slot(admit):
+            stream = build(pipeline.provider_api(provider, kind, use_cache), provider, *inputs)
+            text = await stream.read()
+        return text, {"provider": provider, "ttft": stream.ttft, "seconds": stream.elapsed}
+
+    async def respond(stage, provider, kind, body, build, *inputs):
+        text, timing = await asyncio.wait_for(run_stage(stage, provider, kind, body.use_cache, build, *inputs), timeout)
+        return {"stage": stage, "text": text, **timing}
+
+    @app.post("/v1/style")
+    async def style(body: StyleRequest):
+        return await respond("style", provider_of(body, default_provider), "prompt", body, pipeline.style_desc, body.style, body.nsfw)
+
+    @app.post("/v1/image")
+    async def image(body: ImageRequest):
+        return await respond(
+            "image", provider_of(body, default_vision), "vision", body, pipeline.image_desc, decode_image(body.image), body.nsfw)
+
+    @app.post("/v1/artist")
+    async def artist(body: ArtistRequest):
+        return await respond(
+            "artist", provider_of(body, default_provider), "prompt", body, pipeline.artist_rec, body.style, body.image_desc, body.nsfw)
+
+    @app.post("/v1/generate")
+    async def generate(body: GenerateRequest):
+        base_inst = body.base_instruction or pipeline.base_prompts()["generate"]
+        return await respond(
+            "generate", provider_of(body, default_provider), "prompt", body, pipeline.prompt_gen,
+            base_inst, body.style, body.image_desc, body.artist_desc, body.nsfw,
+        )
+
+    @app.post("/v1/sd_convert")
+    async def sd_convert(body: SDRequest):
+        return await respond(
+            "sd_convert", provider_of(body, default_provider), "prompt", body, pipeline.sd_prompt, body.fusion_prompt, body.nsfw)
+
+    @app.post("/v1/chain")
+    async def chain(body: ChainRequest):
+        provider = provider_of(body, default_provider)
+        vision = body.vision_provider or default_vision
+        if vision not in pipeline.PROVIDERS:
+            raise ValueError(f"unknown provider '{vision}'")
+        img = decode_image(body.image)
+
+        async def run():
+            stages = {}
+
+            async def step(stage, p, kind, build, *inputs):
+                text, stages[stage] = await run_stage(stage, p, kind, body.use_cache, build, *inputs, admit=False)
+                return text
+
+            async with limits["chain"].slot():
+                started = time.perf_counter()
+                style_desc, image_desc = await asyncio.gather(
+                    step("style", provider, "prompt", pipeline.style_desc, body.style, body.nsfw),
+                    step("image", vision, "vision", pipeline.image_desc, img, body.nsfw),
+                )
+                base_inst = body.base_instruction or pipeline.base_prompts()["generate"]
+                if body.fused:
+                    async with limits["generate"].slot(admit=False):
+                        fused, report = await pipeline.fused(
+                            pipeline.provider_api(provider, "prompt", body.use_cache), provider, base_inst, body.style, image_desc, body.nsfw)
+                    stages["fused"] = {"provider": provider, **report}
+                    if not body.sd:
+                        del fused["sd_prompt"]
+                    result = {"style_desc": style_desc, "image_desc": image_desc, **fused}
+                    return {**result, "seconds": time.perf_counter() - started, "stages": stages}
+                artist_desc = await step("artist", provider, "prompt", pipeline.artist_rec, body.style, image_desc, body.nsfw)
+                prompt = await step(
+                    "generate", provider, "prompt", pipeline.prompt_gen, base_inst, body.style, image_desc, artist_desc, body.nsfw)
+                result = {"style_desc": style_desc, "image_desc": image_desc, "artist": artist_desc, "prompt": prompt}
+                if body.sd:
+                    result["sd_prompt"] = await step("sd_convert", provider, "prompt", pipeline.sd_prompt, prompt, body.nsfw)
+                return {**result, "seconds": time.perf_counter() - started, "stages": stages}
+
+        return await asyncio.wait_for(run(), chain_timeout)
+
+    @app.get("/health")
+    async def health():
+        return {"pid": os.getpid(), "config_load_seconds": Config.load_seconds, "stages": {name: limit.snapshot() for name, limit in limits.items()}}
+
+    @app.get("/metrics")
+    async def metrics_endpoint():
+        return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+    return app
@@ -0,0 +1,127 @@
+import json
+import time
+from utils.errors import APIError, RateLimitError, ServerError
+
+
+def _decode(line):
+    return line.decode("utf-8") if isinstance(line, bytes) else line
+
+
+_DONE = object()
+
+
+def _stream_error(error):
+    """Typed error for an error object sent inside a stream (OpenRouter: {"code", "message"}, Ollama: a string)."""
+    message = error.get("message", json.dumps(error)) if isinstance(error, dict) else str(error)
+    status = error.get("code") if isinstance(error, dict) and isinstance(error.get("code"), int) else None
+    message = f"error in response stream: {message}"
+    if status == 429:
+        return RateLimitError(message, status=status)
+    if status is not None and (status >= 500 or status == 408):
+        return ServerError(message, status=status)
+    return APIError(message, status=status)
+
+
+def _sse_delta(line):
+    """Parse one SSE line into a content delta, None to skip it, or _DONE."""
+    line = _decode(line).strip() if line else ""
+    if not line.startswith("data:"):
+        return None  # blank separators, ": keep-alive" comments, event/id fields
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return _DONE
+    event = json.loads(data)
+    if event.get("error"):
+        raise _stream_error(event["error"])
+    choices = event.get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content")
+
+
+def iter_sse(lines):
+    """Yield content deltas from OpenAI-compatible server-sent event lines."""
+    for line in lines:
+        delta = _sse_delta(line)
+        if delta is _DONE:
+            return
+        if delta:
+            yield delta
+
+
+def iter_ndjson(lines, field="response"):
+    """Yield one field from each line of an Ollama NDJSON stream."""
+    for line in lines:
+        if line:
+            event = json.loads(_decode(line))
+            if event.get("error"):
+                raise _stream_error(event["error"])
+            delta = event.get(field, "")
+            if delta:
+                yield delta
+
+
+async def aiter_sse(lines):
+    """Async variant of iter_sse()."""
+    async for line in lines:
+        delta = _sse_delta(line)
+        if delta is _DONE:
+            return
+        if delta:
+            yield delta
+
+
+async def aiter_ndjson(lines, field="response"):
+    """Async variant of iter_ndjson()."""
+    async for line in lines:
+        for delta in iter_ndjson([line], field):
+            yield delta
+
+
+class TokenStream:
+    """Iterate deltas from a generator while buffering them (linear time) and timing the stream."""
+
+    def __init__(self, deltas):
+        self._deltas = deltas
+        self.parts = []
+        self.started = None
+        self.ttft = None
+        self.elapsed = None
+
+    def _mark(self, delta):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+        self.parts.append(delta)
+
+    def __iter__(self):
+        self.started = time.perf_counter()
+        for delta in self._deltas:
+            self._mark(delta)
+            yield delta
+        self.elapsed = time.perf_counter() - self.started
+
+    def text(self):
+        return "".join(self.parts)
+
+    def read(self):
+        """Drain the stream and return the full text."""
+        for _ in self:
+            pass
+        return self.text()
+
+
+class AsyncTokenStream(TokenStream):
+    """TokenStream over an async generator of deltas."""
+
+    async def __aiter__(self):
+        self.started = time.perf_counter()
+        async for delta in self._deltas:
+            self._mark(delta)
+            yield delta
+        self.elapsed = time.perf_counter() - self.started
+
+    def __iter__(self):
+        raise TypeError("AsyncTokenStream must be consumed with 'async for'")
+
+    async def read(self):
+        async for _ in self:
+            pass
+        return self.text()
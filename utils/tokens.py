@@ -0,0 +1,119 @@
+import os
+import re
+import logging
+from utils import metrics
+
+# Context windows by model name prefix (longest match wins); override with <PROVIDER>_CONTEXT_WINDOW
+CONTEXT_WINDOWS = {
+    "gpt-4o": 128_000,
+    "gpt-4.1": 1_047_576,
+    "gpt-4-turbo": 128_000,
+    "gpt-4": 8_192,
+    "gpt-3.5-turbo": 16_385,
+    "o1": 200_000,
+    "o3": 200_000,
+    "o4": 200_000,
+    "cohere/command-r": 128_000,
+    "qwen/qwen-2-vl": 32_768,
+    "x-ai/grok-3": 131_072,
+    "x-ai/grok-2-vision": 32_768,
+}
+DEFAULT_CONTEXT_WINDOW = 8_192
+OLLAMA_CONTEXT_WINDOW = 4_096  # Ollama's default num_ctx
+
+# Tokens an attached image costs, by detail level
+IMAGE_TOKENS = {"low": 85, "high": 765, "auto": 765}
+
+# Default budgets (tokens) for model-generated text pasted into later prompts
+INPUT_BUDGETS = {"image_desc": 1000, "artist": 500, "prompt": 1500}
+
+_encodings = {}
+
+
+def _encoding(model):
+    """tiktoken encoding for a model, or None when tiktoken is unavailable (falls back to an estimate)."""
+    if model in _encodings:
+        return _encodings[model]
+    encoding = None
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model((model or "").split("/")[-1])
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+    except ImportError:
+        pass
+    except Exception as e:  # tiktoken fetches its vocabularies on first use
+        logging.warning(f"tiktoken unavailable, estimating token counts: {str(e)}")
+    _encodings[model] = encoding
+    return encoding
+
+
+def count_tokens(text, model=None):
+    """Tokens in text for a model: exact with tiktoken installed, otherwise about 4 characters per token."""
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate(text, max_tokens, model=None):
+    """Cut text to at most max_tokens tokens on a token boundary (a word boundary when estimating)."""
+    if max_tokens is None or count_tokens(text, model) <= max_tokens:
+        return text
+    encoding = _encoding(model)
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    cut = text[:max_tokens * 4]
+    space = cut.rfind(" ")
+    return cut[:space] if space > len(cut) // 2 else cut
+
+
+def compact(text, max_tokens, model=None):
+    """Shrink text to a token budget without a model call: collapse whitespace, drop repeated
+    sentences, keep whole sentences from the start, and cut the remainder on a token boundary."""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    text = re.sub(r"\s+", " ", text).strip()
+    kept, seen, used = [], set(), 0
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        key = sentence.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        cost = count_tokens(sentence, model) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(sentence)
+        used += cost
+    return " ".join(kept) if kept else truncate(text, max_tokens, model)
+
+
+def fit(text, name, model=None):
+    """Compact a named prompt input (image_desc, artist, prompt) to its budget from INPUT_BUDGET_<NAME>."""
+    budget = int(os.getenv(f"INPUT_BUDGET_{name.upper()}", INPUT_BUDGETS[name]))
+    before = count_tokens(text, model)
+    if before <= budget:
+        return text
+    compacted = compact(text, budget, model)
+    saved = before - count_tokens(compacted, model)
+    metrics.COMPACTED_TOKENS.inc(saved, input=name)
+    logging.info(f"Compacted {name} from {before} to {before - saved} tokens")
+    return compacted
+
+
+def context_window(provider, model):
+    override = os.getenv(f"{provider.upper()}_CONTEXT_WINDOW")
+    if override:
+        return int(override)
+    if provider == "ollama":
+        return OLLAMA_CONTEXT_WINDOW
+    name = (model or "").lower().removeprefix("openai/")
+    matches = [prefix for prefix in CONTEXT_WINDOWS if name.startswith(prefix)]
+    return CONTEXT_WINDOWS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
+
+
+def max_output_tokens(provider, model, prompt_tokens, limit):
+    """Output budget: the configured limit, capped by what the context window leaves after the prompt."""
+    remaining = context_window(provider, model) - prompt_tokens - 16  # chat formatting overhead
+    return max(1, min(int(limit), remaining))
@@ -0,0 +1,117 @@
+import os
+import asyncio
+import logging
+import threading
+import weakref
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def base_url(url):
+    """Reduce a full endpoint URL to the scheme://host:port its connections belong to."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class Transport:
+    """Process-wide keep-alive connection pools, one requests.Session per base URL."""
+    pool_size = int(os.getenv("HTTP_POOL_SIZE", "16"))
+    connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+    read_timeout = float(os.getenv("HTTP_READ_TIMEOUT", "300"))
+
+    _sessions = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, pool_size=None, connect_timeout=None, read_timeout=None):
+        """Change pool sizing or timeouts; existing pools are closed and rebuilt lazily."""
+        if pool_size is not None:
+            cls.pool_size = int(pool_size)
+        if connect_timeout is not None:
+            cls.connect_timeout = float(connect_timeout)
+        if read_timeout is not None:
+            cls.read_timeout = float(read_timeout)
+        cls.close()
+
+    @classmethod
+    def timeout(cls):
+        return (cls.connect_timeout, cls.read_timeout)
+
+    @classmethod
+    def session(cls, url):
+        key = base_url(url)
+        with cls._lock:
+            session = cls._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=cls.pool_size, pool_block=False)
+                session.mount(key, adapter)
+                session.headers.update({"Connection": "keep-alive"})
+                cls._sessions[key] = session
+                logging.info(f"Opened connection pool for {key} (size {cls.pool_size})")
+            return session
+
+    @classmethod
+    def post(cls, url, **kwargs):
+        kwargs.setdefault("timeout", cls.timeout())
+        return cls.session(url).post(url, **kwargs)
+
+    @classmethod
+    def get(cls, url, **kwargs):
+        kwargs.setdefault("timeout", cls.timeout())
+        return cls.session(url).get(url, **kwargs)
+
+    @classmethod
+    def close(cls):
+        with cls._lock:
+            sessions, cls._sessions = cls._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+
+class AsyncTransport:
+    """Async counterpart of Transport backed by one httpx.AsyncClient per base URL and event loop."""
+    _clients = weakref.WeakKeyDictionary()  # event loop -> {base URL: client}, dropped with the loop
+    _lock = threading.Lock()
+
+    @classmethod
+    def client(cls, url):
+        import httpx
+
+        key = base_url(url)
+        with cls._lock:
+            clients = cls._clients.setdefault(asyncio.get_running_loop(), {})
+            client = clients.get(key)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=Transport.pool_size,
+                        max_keepalive_connections=Transport.pool_size,
+                    ),
+                    timeout=httpx.Timeout(Transport.read_timeout, connect=Transport.connect_timeout),
+                )
+                clients[key] = client
+            return client
+
+    @classmethod
+    async def post(cls, url, **kwargs):
+        return await cls.client(url).post(url, **kwargs)
+
+    @classmethod
+    async def get(cls, url, **kwargs):
+        return await cls.client(url).get(url, **kwargs)
+
+    @classmethod
+    def stream(cls, url, **kwargs):
+        """Return an async context manager yielding a streamed httpx response."""
+        return cls.client(url).stream("POST", url, **kwargs)
+
+    @classmethod
+    async def close(cls):
+        """Close the running loop's clients; other loops' clients are left to their own loop."""
+        with cls._lock:
+            clients = cls._clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.aclose()